@@ -1,27 +1,32 @@
-import os
-from time import sleep
-from sickle import Sickle
+import argparse
+from recolha import URL, janelas_datas, recolher
 
 # Descarregar os registos OAI-PMH (Open Archives Initiative Protocol for Metadata Harvesting)
-url = "https://www.arquivoalbertosampaio.org/OAI-PMH/"
+# em oai_dc (padrão simples e comum). A recolha é retomável: se for interrompida,
+# voltar a correr o mesmo comando continua a partir da última página gravada.
 
-sickle = Sickle(url) # obj sickle do url
-records = sickle.ListRecords(metadataPrefix='oai_dc') # padrão simples e comum
+def main():
+    parser = argparse.ArgumentParser(description="Descarrega o arquivo por OAI-PMH.")
+    parser.add_argument("--url", default=URL)
+    parser.add_argument("--dir", default="records", help="diretoria dos registos XML")
+    parser.add_argument("--sets", nargs="*", help="setSpecs a recolher em paralelo (sem valores: todos)")
+    parser.add_argument("--desde", type=int, help="dividir por janelas de datestamp a partir deste ano")
+    parser.add_argument("--ate", type=int, help="último ano das janelas de datestamp")
+    parser.add_argument("--passo", type=int, default=1, help="anos por janela")
+    parser.add_argument("--workers", type=int, default=4, help="partições descarregadas em simultâneo")
+    parser.add_argument("--taxa", type=float, default=2.0, help="pedidos por segundo (total)")
+    args = parser.parse_args()
+
+    sets = None
+    if args.sets is not None:
+        sets = args.sets or "todos"
+    janelas = None
+    if args.desde is not None:
+        janelas = list(janelas_datas(args.desde, args.ate or args.desde, args.passo))
+
+    recolher(args.url, args.dir, sets=sets, janelas=janelas, workers=args.workers, taxa=args.taxa)
 
-def save_records(directory_name="records"): 
-    os.makedirs(directory_name, exist_ok=True)
-       
-    n = 0
-    for i, record in enumerate(records):
-        with open(f"records/record_{i}.xml", "w", encoding="utf-8") as f:
-            f.write(str(record.raw))
-        n += 1
-        if n == 500:  
-            n = 0
-            sleep(5)
-        
 
 if __name__ == "__main__":
-    save_records()
+    main()
     print("Registos descarregados com sucesso.")
-
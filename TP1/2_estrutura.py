@@ -1,49 +1,56 @@
 import xml.etree.ElementTree as ET
-import yaml
 import sys
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from ingestao import Ingestao, atualizar_manifesto
+from registos import DB_REGISTOS, Registos
 
-def parse_record_to_dict(record_xml):
-    ns = {
-        'oai': 'http://www.openarchives.org/OAI/2.0/',
-        'dc': 'http://purl.org/dc/elements/1.1/',
-        'oai_dc': 'http://www.openarchives.org/OAI/2.0/oai_dc/'
-    }
+OAI = '{http://www.openarchives.org/OAI/2.0/}'
+DC = '{http://purl.org/dc/elements/1.1/}'
+OAI_DC = '{http://www.openarchives.org/OAI/2.0/oai_dc/}'
 
+def parse_record_to_dict(record_xml):
     root = ET.fromstring(record_xml)
 
     # Header
-    header = root.find('oai:header', ns)
-    identifier = header.find('oai:identifier', ns).text.strip()
-    sets = [s.text.strip() for s in header.findall('oai:setSpec', ns)]
+    header = root.find(f'{OAI}header')
+    identifier = header.find(f'{OAI}identifier').text.strip()
+    sets = [s.text.strip() for s in header.findall(f'{OAI}setSpec')]
 
     # Metadata
-    metadata = root.find('oai:metadata/oai_dc:dc', ns)
+    metadata = root.find(f'{OAI}metadata/{OAI_DC}dc')
+    if metadata is None:
+        # Registo apagado (header status="deleted"): não tem metadados
+        return None
 
-    def get_dc(tag):
-        return [e.text.strip() for e in metadata.findall(f'dc:{tag}', ns)]
+    # Uma só passagem pelos filhos dc:*, agrupando os valores por campo
+    dc = {}
+    for e in metadata:
+        if e.tag.startswith(DC) and e.text:
+            dc.setdefault(e.tag[len(DC):], []).append(e.text.strip())
 
-    data_raw = get_dc('date')
-    data = simplify_date(data_raw)
-    date_inicio = data['inicio']
-    date_fim = data['fim']
-    certeza_data = data['certeza']
+    def first(tag):
+        values = dc.get(tag)
+        return values[0] if values else None
+
+    data = simplify_date(dc.get('date', []))
 
     record = {
         'id': identifier,
-        'titulo': get_dc('title')[0] if get_dc('title') else None,
+        'titulo': first('title'),
         'datas': {
-            'inicio': date_inicio,
-            'fim': date_fim,
-            'certeza': certeza_data
+            'inicio': data['inicio'],
+            'fim': data['fim'],
+            'certeza': data['certeza']
         },
-        'editor': get_dc('publisher')[0] if get_dc('publisher') else None,
-        'assunto': get_dc('subject')[0] if get_dc('subject') else None,
-        'tipo': get_dc('type')[0] if get_dc('type') else None,
-        'formato': get_dc('format')[0] if get_dc('format') else None,
-        'lingua': get_dc('language')[0] if get_dc('language') else None,
-        'identificadores': get_dc('identifier'),
-        'thumbnail': get_dc('relation')[0] if get_dc('relation') else None,
+        'editor': first('publisher'),
+        'assunto': first('subject'),
+        'tipo': first('type'),
+        'formato': first('format'),
+        'lingua': first('language'),
+        'identificadores': dc.get('identifier', []),
+        'thumbnail': first('relation'),
         'colecoes': sets,
     }
     return record
@@ -51,7 +58,7 @@ def parse_record_to_dict(record_xml):
 def simplify_date(date_values):
     if not date_values:
         return {'inicio': None, 'fim': None, 'certeza': 'desconhecida'}
-    
+
     # Handle cases where date might be a single year or range
     if len(date_values) == 1:
         date_str = date_values[0]
@@ -62,17 +69,53 @@ def simplify_date(date_values):
             return {'inicio': date_str.strip(), 'fim': date_str.strip(), 'certeza': 'exata'}
     else:
         return {'inicio': date_values[0].strip(), 'fim': date_values[-1].strip(), 'certeza': 'intervalo'}
-     
 
-def save_records_yaml():
-    os.makedirs("records_yaml", exist_ok=True)
-    for i in range(0, 30920):
-        with open(f"records_yaml/record_{i}.yaml", "w", encoding="utf-8") as f:
-            xml = open(f"records/record_{i}.xml", "r", encoding="utf-8").read()
-            r = parse_record_to_dict(xml)
-            f.write(yaml.dump(r, allow_unicode=True, sort_keys=False))
-            print(f"Registo {i} convertido e guardado em YAML.")
+
+def converter_lote(input_dir, ficheiros):
+    """Converte um lote de ficheiros XML; devolve pares (nome sem extensão, registo)."""
+    convertidos = []
+    for ficheiro in ficheiros:
+        with open(os.path.join(input_dir, ficheiro), 'r', encoding='utf-8') as f:
+            r = parse_record_to_dict(f.read())
+        if r is not None:
+            convertidos.append((ficheiro[:-4], r))
+    return convertidos
+
+
+def save_records(input_dir="records", db=DB_REGISTOS, workers=None, lote=500):
+    """
+    Converte os registos XML novos ou alterados e guarda-os no armazém `db`,
+    um lote de cada vez; os registos cujo ficheiro desapareceu são apagados.
+    """
+    inicio = time.perf_counter()
+    manifesto = atualizar_manifesto(input_dir)
+
+    n = 0
+    with Registos(db) as store, ProcessPoolExecutor(max_workers=workers) as pool:
+        ingestao = Ingestao(store.conn, "estrutura")
+        pendentes, removidos = ingestao.delta(manifesto)
+        store.remover(f[:-4] for f in removidos)
+        with store.conn:
+            ingestao.esquecer(removidos)
+
+        lotes = [pendentes[i:i + lote] for i in range(0, len(pendentes), lote)]
+        for ficheiros, convertidos in zip(lotes, pool.map(converter_lote, [input_dir] * len(lotes), lotes)):
+            # A versão anterior sai sempre: um registo apagado no OAI deixa de ter metadados
+            store.remover(f[:-4] for f in ficheiros)
+            store.guardar(convertidos)
+            with store.conn:
+                ingestao.marcar((f, manifesto[f]) for f in ficheiros)
+            n += len(convertidos)
+
+    duracao = time.perf_counter() - inicio
+    print(f"{n} registos convertidos e guardados em {db} em {duracao:.1f}s ({n / max(duracao, 1e-9):.0f} registos/s); "
+          f"{len(removidos)} removidos, {len(manifesto) - len(pendentes)} inalterados.")
+    return n
 
 
 if __name__ == "__main__":
-    save_records_yaml()
+    # python3 2_estrutura.py [--yaml]  (--yaml exporta também records_yaml/ para leitura humana)
+    save_records()
+    if "--yaml" in sys.argv:
+        with Registos() as store:
+            print(f"{store.exportar_yaml('records_yaml')} registos exportados para records_yaml/.")
@@ -1,188 +1,163 @@
+import hashlib
+import io
+import json
 import os
+import shutil
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 import yaml
-from typing import Dict, List, Optional
-
-class ArchivalNode:
-    def __init__(self,id: str,title: str,tipo: str,full_id: str, parent_id: Optional[str] = None,children: Optional[List['ArchivalNode']] = None):
-        self.id = id
-        self.title = title
-        self.tipo = tipo
-        self.full_id = full_id
-        self.parent_id = parent_id
-        self.children = children if children is not None else []
-
-    def __repr__(self, level=0):
-        tipo_label = f" [{self.tipo}]" if self.tipo else ""
-        ret = "\t" * level + f"{self.id}{tipo_label} - {self.title}\n"
-        for child in sorted(self.children, key=lambda x: x.id):
-            ret += child.__repr__(level + 1)
-        return ret
+from typing import Dict, List, Optional, Tuple
+from arvore import (ArchivalNode, EmissorHTML, EmissorMarkdown, EmissorTexto, EmissorWiki, arvore_de_registos,
+                    construir_arvore, raizes, renderizar, tipo_por_omissao)
+from escrita import escrever
+from registos import DB_REGISTOS, Registos
+
+def load_records(db: str = DB_REGISTOS) -> Dict[str, ArchivalNode]:
+    """Load all records from the record store and construct full node hierarchy."""
+    with Registos(db) as store:
+        return tipo_por_omissao(construir_arvore(store))
+
 
 def load_yaml_records(directory: str) -> Dict[str, ArchivalNode]:
-    """Load all YAML records and construct full node hierarchy."""
-    nodes = {}
-    records_by_id = {}
-
-    # Carregar todos os records e armazenar por identificador
-    for filename in os.listdir(directory):
-        if filename.endswith('.yaml'):
-            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
-                record = yaml.safe_load(f)
-                full_id = next((id for id in record.get('identificadores', []) if id.startswith('PT/')), None)
-                if not full_id:
-                    continue
-                records_by_id[full_id] = record
-
-    # Criar toda a cadeia hierárquica
-    def ensure_node_chain(full_id):
-        parts = full_id.split("/")
-        for i in range(1, len(parts) + 1):
-            sub_id = "/".join(parts[:i])
-            if sub_id not in nodes:
-                node_id = parts[i - 1]
-                record = records_by_id.get(sub_id, {})
-                title = record.get("titulo", f"({node_id})")
-                tipo = record.get("tipo")
-
-                # Inferir tipo, se não existir
-                if tipo is None:
-                    if i == 1:
-                        tipo = 'F'
-                    elif i == 2:
-                        tipo = 'SC'
-                    elif i == 3:
-                        tipo = 'SSC'
-                    elif i == 4:
-                        tipo = 'SR'
-                    else:
-                        tipo = 'UI'
-
-                parent_id = "/".join(parts[:i - 1]) if i > 1 else None
-
-                nodes[sub_id] = ArchivalNode(
-                    id=node_id,
-                    title=title,
-                    tipo=tipo,
-                    full_id=sub_id,
-                    parent_id=parent_id
-                )
-
-    for full_id in records_by_id:
-        ensure_node_chain(full_id)
-
-    # Criar relações pai-filho
-    for node in nodes.values():
-        if node.parent_id in nodes:
-            nodes[node.parent_id].children.append(node)
-
-    return nodes
-
-
-def generate_directory_structure(nodes: Dict[str, ArchivalNode], base_path: str = "output/arvore"):
+    """Load all YAML records (e.g. a records_yaml/ export) and construct full node hierarchy."""
+    return load_yaml_records_and_files(directory)[0]
+
+
+def load_yaml_records_and_files(directory: str) -> Tuple[Dict[str, ArchivalNode], Dict[str, str]]:
+    """
+    Like `load_yaml_records`, but also returns the index {identifier: filename} built
+    while reading, used to link nodes to their YAML files without rescanning the directory.
+    """
+    files = {}
+
+    def records():
+        for filename in os.listdir(directory):
+            if filename.endswith('.yaml'):
+                with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                    record = yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+                for ident in record.get("identificadores", []):
+                    files.setdefault(ident, filename)
+                yield record
+
+    return tipo_por_omissao(construir_arvore(records())), files
+
+
+def yaml_files(db: str = DB_REGISTOS) -> Dict[str, str]:
+    """Index {full_id: YAML filename} of the records in the store, as written by `registos.py yaml`."""
+    with Registos(db) as store:
+        return {codigo: f"{ficheiro}.yaml" for codigo, ficheiro in store.ficheiros().items()}
+
+
+MANIFESTO_DIRETORIAS = ".manifesto.json"
+
+
+def _readme(node: ArchivalNode) -> str:
+    readme = f"# {node.id} {node.tipo} - {node.title}\n\n- **ID Completo**: {node.full_id}\n"
+    if node.parent_id:
+        readme += f"- **Parent ID**: {node.parent_id}\n"
+    return readme
+
+def directory_plan(nodes: Dict[str, ArchivalNode]) -> List[Tuple[int, str, str]]:
+    """(nível, caminho relativo, conteúdo do README.md) de cada nó, em pré-ordem."""
+    plano = []
+    pilha = [(root, 0, "") for root in reversed(raizes(nodes))]
+    while pilha:
+        node, nivel, parent_path = pilha.pop()
+        # Directory name with format: ID-TIPO-Title
+        path = os.path.join(parent_path, f"{node.id}-{node.tipo}-{node.title.replace('/', '_')}")
+        plano.append((nivel, path, _readme(node)))
+        pilha.extend((child, nivel + 1, path) for child in reversed(node.children))
+    return plano
+
+def generate_directory_structure(nodes: Dict[str, ArchivalNode], base_path: str = "output/arvore",
+                                 workers: int = 16, incremental: bool = False) -> int:
+    """
+    Cria uma diretoria com um README.md por nó.
+
+    Os caminhos são todos calculados primeiro; as diretorias são criadas nível
+    a nível e os README escritos em paralelo (`workers` threads), o que
+    compensa sobretudo em sistemas de ficheiros de rede. Com `incremental`,
+    só são tocados os nós novos ou alterados desde a última execução
+    (segundo `.manifesto.json` em `base_path`) ou cuja diretoria já não
+    existe, e as diretorias de nós que desapareceram são removidas. Devolve o número de nós escritos.
+    """
     os.makedirs(base_path, exist_ok=True)
-    
-    # Find root nodes (nodes with no parent or parent not in nodes)
-    root_nodes = [node for node in nodes.values() 
-                 if node.parent_id is None or node.parent_id not in nodes]
-    
-    # Process each root node
-    for root in sorted(root_nodes, key=lambda x: x.id):
-        _create_directory_structure(root, base_path, nodes)
-
-def _create_directory_structure(node: ArchivalNode, current_path: str, nodes: Dict[str, ArchivalNode]):
-    # Create directory name with format: ID-TIPO-Title
-    dir_name = f"{node.id}-{node.tipo}-{node.title.replace('/', '_')}"
-    dir_path = os.path.join(current_path, dir_name)
-    
-    # Create the directory
-    os.makedirs(dir_path, exist_ok=True)
-    
-    # Create a README file with node information
-    with open(os.path.join(dir_path, "README.md"), 'w', encoding='utf-8') as f:
-        f.write(f"# {node.id} {node.tipo} - {node.title}\n\n")
-        f.write(f"- **ID Completo**: {node.full_id}\n")
-        if node.parent_id:
-            f.write(f"- **Parent ID**: {node.parent_id}\n")
-    
-    # Process children
-    for child in sorted(node.children, key=lambda x: x.id):
-        _create_directory_structure(child, dir_path, nodes)
+    manifesto_path = os.path.join(base_path, MANIFESTO_DIRETORIAS)
+    anterior = {}
+    if incremental and os.path.exists(manifesto_path):
+        with open(manifesto_path, encoding="utf-8") as f:
+            anterior = json.load(f)
+
+    plano = directory_plan(nodes)
+    atual = {path: hashlib.sha1(readme.encode("utf-8")).hexdigest() for _, path, readme in plano}
+    # Um nó inalterado só é saltado se a sua diretoria ainda existir (pode ter sido apagada à mão)
+    pendentes = [(nivel, path, readme) for nivel, path, readme in plano
+                 if anterior.get(path) != atual[path] or not os.path.isdir(os.path.join(base_path, path))]
+
+    def write_readme(item):
+        _, path, readme = item
+        with open(os.path.join(base_path, path, "README.md"), 'w', encoding='utf-8') as f:
+            f.write(readme)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Diretorias que já não existem na árvore (do mais fundo para o mais alto)
+        for path in sorted(anterior.keys() - atual.keys(), key=len, reverse=True):
+            shutil.rmtree(os.path.join(base_path, path), ignore_errors=True)
+
+        por_nivel = {}
+        for nivel, path, _ in pendentes:
+            por_nivel.setdefault(nivel, []).append(os.path.join(base_path, path))
+        for nivel in sorted(por_nivel):
+            list(pool.map(lambda p: os.makedirs(p, exist_ok=True), por_nivel[nivel]))
+        list(pool.map(write_readme, pendentes))
+
+    with open(manifesto_path, "w", encoding="utf-8") as f:
+        json.dump(atual, f, ensure_ascii=False)
+    return len(pendentes)
+
+def export_directory_archive(nodes: Dict[str, ArchivalNode], output: str):
+    """
+    A mesma estrutura de diretorias num único arquivo .zip ou .tar (.tar.gz),
+    escrito sequencialmente sem criar nenhuma diretoria no disco.
+    """
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    plano = directory_plan(nodes)
+    if output.endswith(".zip"):
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as z:
+            for _, path, readme in plano:
+                z.writestr(f"{path}/README.md", readme)
+        return
+
+    agora = time.time()
+    with tarfile.open(output, "w:gz" if output.endswith((".tar.gz", ".tgz")) else "w") as tar:
+        for _, path, readme in plano:
+            diretoria = tarfile.TarInfo(path)
+            diretoria.type, diretoria.mode, diretoria.mtime = tarfile.DIRTYPE, 0o755, agora
+            tar.addfile(diretoria)
+            dados = readme.encode("utf-8")
+            ficheiro = tarfile.TarInfo(f"{path}/README.md")
+            ficheiro.size, ficheiro.mtime = len(dados), agora
+            tar.addfile(ficheiro, io.BytesIO(dados))
 
 def generate_text_tree(nodes: Dict[str, ArchivalNode]) -> str:
-    # Find root nodes
-    root_nodes = [node for node in nodes.values() 
-                 if node.parent_id is None or node.parent_id not in nodes]
-    
-    output = ""
-    for root in sorted(root_nodes, key=lambda x: x.id):
-        output += root.__repr__()
-    return output
-
-def generate_html_tree_with_links(nodes: Dict[str, ArchivalNode], html_output: str, record_dir: str):
-    root_nodes = [n for n in nodes.values() if n.parent_id not in nodes]
-
-    def build_html(node: ArchivalNode) -> str:
-        filename = None
-        for fname in os.listdir(record_dir):
-            if fname.endswith(".yaml"):
-                path = os.path.join(record_dir, fname)
-                with open(path, encoding="utf-8") as f:
-                    data = yaml.safe_load(f)
-                    if node.full_id in data.get("identificadores", []):
-                        filename = fname
-                        break
-
-        label = f"{node.id}-{node.tipo}-{node.title}".replace("/", "_")
-        if filename:
-            label = f'<a href="../{record_dir}/{filename}">{label}</a>'
-
-        html = [f"<li>{label}"]
-        if node.children:
-            html.append("<ul>")
-            for child in sorted(node.children, key=lambda x: x.id):
-                html.append(build_html(child))
-            html.append("</ul>")
-        html.append("</li>")
-        return '\n'.join(html)
-
-    html_lines = [
-        "<html><head><meta charset='UTF-8'><title>Árvore Arquivística</title></head><body>",
-        "<h1>Árvore Arquivística</h1>",
-        "<ul>"
-    ]
-
-    for root in sorted(root_nodes, key=lambda x: x.id):
-        html_lines.append(build_html(root))
-
-    html_lines += ["</ul>", "</body></html>"]
-
-    os.makedirs(os.path.dirname(html_output), exist_ok=True)
-    with open(html_output, "w", encoding="utf-8") as f:
-        f.write("\n".join(html_lines))
-
-def generate_wiki_tree(nodes: Dict[str, ArchivalNode], wiki_output: str):
-    root_nodes = [n for n in nodes.values() if n.parent_id not in nodes]
+    return "".join(renderizar(raizes(nodes), EmissorTexto()))
 
-    def build_wiki(node: ArchivalNode, level: int = 0) -> str:
-        # Indenta conforme o nível da árvore
-        indentation = '    ' * level
-        wiki = [f"{indentation}* {node.id} - {node.tipo} - {node.title}"]  # Sem links
-        if node.children:
-            for child in sorted(node.children, key=lambda x: x.id):
-                wiki.append(build_wiki(child, level + 1))  # Recursão com nível aumentado
-        return '\n'.join(wiki)
+def generate_html_tree_with_links(nodes: Dict[str, ArchivalNode], html_output: str, record_dir: str,
+                                  files: Optional[Dict[str, str]] = None):
+    # files: {full_id: ficheiro YAML}; sem índice, é construído uma vez a partir de record_dir
+    if files is None:
+        files = load_yaml_records_and_files(record_dir)[1]
+    escrever(renderizar(raizes(nodes), EmissorHTML(record_dir, files)), html_output)
 
-    wiki_lines = [
-        "== Árvore Arquivística ==\n",
-        "Lista de todos os nós e seus identificadores:\n"
-    ]
-
-    for root in sorted(root_nodes, key=lambda x: x.id):
-        wiki_lines.append(build_wiki(root))
+def generate_wiki_tree(nodes: Dict[str, ArchivalNode], wiki_output: str):
+    escrever(renderizar(raizes(nodes), EmissorWiki()), wiki_output)
 
-    os.makedirs(os.path.dirname(wiki_output), exist_ok=True)
-    with open(wiki_output, "w", encoding="utf-8") as f:
-        f.write("\n".join(wiki_lines))
+def generate_markdown_tree(nodes: Dict[str, ArchivalNode], md_output: str, record_dir: str = "",
+                           files: Optional[Dict[str, str]] = None):
+    escrever(renderizar(raizes(nodes), EmissorMarkdown(record_dir, files)), md_output)
 
 
 def save_output(content: str, filename: str):
@@ -192,25 +167,32 @@ def save_output(content: str, filename: str):
         f.write(content)
 
 if __name__ == "__main__":
+    # O HTML liga cada nó ao seu YAML: exportar com `python3 registos.py yaml` (ou 2_estrutura.py --yaml)
     yaml_dir = "records_yaml"
-    nodes = load_yaml_records(yaml_dir)
+    db = sys.argv[1] if len(sys.argv) > 1 else DB_REGISTOS
+    # Os nós abaixo do nível 6 sem tipo ficam como UI, como sempre nesta script
+    nodes = tipo_por_omissao(arvore_de_registos(db))
 
-    # Gerar árvore textual
-    text_tree = generate_text_tree(nodes)
-    save_output(text_tree, "output/archival_tree.txt")
+    # Gerar árvore textual (escrita à medida que é percorrida)
+    escrever(renderizar(raizes(nodes), EmissorTexto()), "output/archival_tree.txt")
 
-    # Gerar estrutura de diretórios
-    generate_directory_structure(nodes, "output/arvore_diretorios")
+    # Gerar estrutura de diretórios (só os nós alterados desde a última execução)
+    generate_directory_structure(nodes, "output/arvore_diretorios", incremental=True)
 
-    # Gerar HTML com links
-    generate_html_tree_with_links(nodes, "output/html_arvore/index.html", yaml_dir)
+    # Gerar HTML com links (índice código -> YAML tirado do armazém, sem reler os YAML)
+    files = yaml_files(db) if os.path.isdir(yaml_dir) else {}
+    generate_html_tree_with_links(nodes, "output/html_arvore/index.html", yaml_dir, files)
 
     # Gerar Wiki
     generate_wiki_tree(nodes, "output/wiki_arvore/wiki.txt")
 
+    # Gerar Markdown (com links relativos para os YAML)
+    generate_markdown_tree(nodes, "output/markdown_arvore/arvore.md", f"../../{yaml_dir}", files)
+
 
     print("Operações concluídas:")
     print("- Árvore textual gerada em: output/archival_tree.txt")
     print("- Estrutura criada em: output/arvore_diretorios/")
     print("- HTML com links gerado em: output/html_arvore/index.html")
     print("- Wiki gerada em: output/wiki_arvore/wiki.txt")
+    print("- Markdown gerado em: output/markdown_arvore/arvore.md")
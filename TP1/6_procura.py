@@ -1,8 +1,11 @@
 import sqlite3
 import os
-import glob
 import xml.etree.ElementTree as ET
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from ingestao import Ingestao, atualizar_manifesto
+from pesquisa import Pesquisa
 
 DB_NAME = "arquivo.db"
 RECORDS_DIR = "records"
@@ -52,89 +55,159 @@ def extrair_dados(xml_path):
         "relacao": relacoes[0] if relacoes else None
     }
 
-def criar_db():
-    if os.path.exists(DB_NAME):
+def criar_db(reset=False):
+    # Só com reset=True se apaga a base de dados; caso contrário as tabelas
+    # são mantidas e inserir_dados() processa apenas o que mudou
+    if reset and os.path.exists(DB_NAME):
         os.remove(DB_NAME)
 
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
 
+    # Bases de dados anteriores às datas inteiras/R*Tree são reconstruídas (só as tabelas desta etapa)
+    tabelas = {t for (t,) in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "documentos" in tabelas and "documentos_datas" not in tabelas:
+        c.execute("DROP TABLE documentos")
+        c.execute("DROP TABLE IF EXISTS documentos_fts")
+        if "ingestao" in tabelas:
+            c.execute("DELETE FROM ingestao WHERE etapa = 'procura'")
+
     c.execute("""
-        CREATE VIRTUAL TABLE documentos_fts USING fts5(
-        titulo, assunto, tipo, formato, texto
+        CREATE VIRTUAL TABLE IF NOT EXISTS documentos_fts USING fts5(
+        titulo, assunto, tipo, formato
         );
     """)
     
+    # Anos como inteiros, com índices B-tree para filtros e ordenação
     c.execute("""
-              CREATE TABLE documentos (
+              CREATE TABLE IF NOT EXISTS documentos (
             rowid INTEGER PRIMARY KEY,
+            ficheiro TEXT UNIQUE,
             codigo TEXT,
-            data_inicio TEXT,
-            data_fim TEXT,
+            tipo TEXT,
+            data_inicio INTEGER,
+            data_fim INTEGER,
             url TEXT,
             relacao TEXT);
         """)
+    c.execute("CREATE INDEX IF NOT EXISTS documentos_tipo ON documentos(tipo, data_inicio, data_fim)")
+    c.execute("CREATE INDEX IF NOT EXISTS documentos_inicio ON documentos(data_inicio)")
+
+    # R*Tree de uma dimensão com o intervalo [data_inicio, data_fim] de cada documento,
+    # para pesquisas por sobreposição de intervalos
+    c.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS documentos_datas USING rtree_i32(id, inicio, fim)
+    """)
     conn.commit()
     conn.close()
 
-def inserir_dados():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-
-    for xml_file in glob.glob(os.path.join(RECORDS_DIR, "*.xml")):
-        dados = extrair_dados(xml_file)
+def remover_documentos(c, ficheiros):
+    # Apaga de ambas as tabelas os documentos vindos destes ficheiros
+    pares = [(f,) for f in ficheiros]
+    c.executemany("DELETE FROM documentos_fts WHERE rowid IN (SELECT rowid FROM documentos WHERE ficheiro = ?)", pares)
+    c.executemany("DELETE FROM documentos_datas WHERE id IN (SELECT rowid FROM documentos WHERE ficheiro = ?)", pares)
+    c.executemany("DELETE FROM documentos WHERE ficheiro = ?", pares)
+
+def extrair_lote(ficheiros):
+    # Corre num processo do pool: devolve (ficheiro, dados) dos registos com metadados
+    lote = []
+    for ficheiro in ficheiros:
+        dados = extrair_dados(os.path.join(RECORDS_DIR, ficheiro))
         if dados:
-            # Inserir na FTS
-            c.execute("""
-                INSERT INTO documentos_fts (titulo, assunto, tipo, formato)
-                VALUES (?, ?, ?, ?)
-            """, (
-                dados["titulo"], dados["assunto"], dados["tipo"], dados["formato"]
-            ))
-
-            # Obter o rowid que foi usado automaticamente
-            rowid = c.lastrowid
-
-            # Inserir na tabela auxiliar
-            c.execute("""
-                INSERT INTO documentos (rowid, codigo, data_inicio, data_fim, url, relacao)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                rowid, dados["codigo"], dados["data_inicio"],
-                dados["data_fim"], dados["url"], dados["relacao"]
-            ))
+            lote.append((ficheiro, dados))
+    return lote
 
-    conn.commit()
-    conn.close()
-
-    
-def procurar(termo):
+def inserir_dados(workers=None, lote=2000):
+    inicio = time.perf_counter()
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
+    # Durante a construção: WAL e sem fsync a cada commit, já que o índice pode sempre ser
+    # reconstruído a partir dos registos. O modo WAL fica gravado no ficheiro, por isso é
+    # desligado no fim
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=OFF")
+
+    # Só os ficheiros novos ou alterados desde a última execução
+    manifesto = atualizar_manifesto(RECORDS_DIR)
+    ingestao = Ingestao(conn, "procura")
+    pendentes, removidos = ingestao.delta(manifesto)
+    remover_documentos(c, removidos + pendentes)
+    ingestao.esquecer(removidos)
+    conn.commit()
 
-    query = """
-        SELECT fts.titulo, d.codigo, d.url
-        FROM documentos_fts fts
-        JOIN documentos d ON fts.rowid = d.rowid
-        WHERE documentos_fts MATCH ?
-    """
+    # Os rowids são atribuídos aqui, para a FTS e a tabela auxiliar ficarem alinhadas sem depender de lastrowid
+    proximo = c.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM documentos").fetchone()[0]
+    lotes = [pendentes[i:i + lote] for i in range(0, len(pendentes), lote)]
+    n = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for ficheiros, extraidos in zip(lotes, pool.map(extrair_lote, lotes)):
+            rowids = range(proximo, proximo + len(extraidos))
+            proximo += len(extraidos)
+            c.executemany("""
+                INSERT INTO documentos_fts (rowid, titulo, assunto, tipo, formato)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(rowid, d["titulo"], d["assunto"], d["tipo"], d["formato"])
+                  for rowid, (_, d) in zip(rowids, extraidos)])
+            c.executemany("""
+                INSERT INTO documentos (rowid, ficheiro, codigo, tipo, data_inicio, data_fim, url, relacao)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(rowid, f, d["codigo"], d["tipo"], d["data_inicio"], d["data_fim"], d["url"], d["relacao"])
+                  for rowid, (f, d) in zip(rowids, extraidos)])
+            c.executemany("INSERT INTO documentos_datas (id, inicio, fim) VALUES (?, ?, ?)",
+                          [(rowid, d["data_inicio"], d["data_fim"])
+                           for rowid, (_, d) in zip(rowids, extraidos) if d["data_inicio"] is not None])
+            ingestao.marcar((f, manifesto[f]) for f in ficheiros)
+            conn.commit()
+            n += len(extraidos)
+
+    # Junta os segmentos do índice FTS num só, para pesquisas mais rápidas
+    if pendentes or removidos:
+        c.execute("INSERT INTO documentos_fts(documentos_fts) VALUES('optimize')")
+    conn.commit()
+    # Volta ao journal por omissão: o índice final é um só ficheiro, sem -wal/-shm
+    c.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
 
-    for row in c.execute(query, (termo,)):
-        titulo, codigo, url = row
-        print(f"\nTítulo: {titulo}\nCódigo: {codigo}\nURL: {url}\n")
+    duracao = time.perf_counter() - inicio
+    print(f"{len(pendentes)} documentos novos/alterados ({n} indexados), {len(removidos)} removidos, "
+          f"{len(manifesto) - len(pendentes)} inalterados.")
+    print(f"Índice construído em {duracao:.2f}s ({n / max(duracao, 1e-9):.0f} documentos/s).")
 
-    conn.close()
+    
+def procurar(termo, pagina=1, por_pagina=20, **filtros):
+    # Resultados ordenados por relevância (bm25), uma página de cada vez;
+    # filtros: inicio/fim (anos, sobreposição de intervalos) e tipo
+    with Pesquisa(DB_NAME, marcas=("[", "]"), escapar=False) as p:
+        total = p.contar(termo, **filtros)
+        for r in p.procurar(termo, limite=por_pagina, offset=(pagina - 1) * por_pagina, **filtros):
+            print(f"\nTítulo: {r['titulo']}\nCódigo: {r['codigo']}\nURL: {r['url']}\n{r['excerto']}\n")
+    print(f"Página {pagina} de {max(1, -(-total // por_pagina))} ({total} resultados)")
 
 
 if __name__ == "__main__":
-    # correr uma vez para inserir os dados
+    # correr depois de cada recolha: só os registos novos/alterados são (re)indexados
     #criar_db()
     #inserir_dados()
 
-    # python3 6_procura.py <termo>")
+    # python3 6_procura.py <termo> [--pagina N] [--de ANO] [--ate ANO] [--tipo T]
     
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+    opcoes = {}
+    for opcao in ("--pagina", "--de", "--ate", "--tipo"):
+        if opcao in args:
+            i = args.index(opcao)
+            opcoes[opcao] = args[i + 1]
+            del args[i:i + 2]
+    if not args:
         exit(1)
 
-    termo = " ".join(sys.argv[1:])
-    procurar(termo)
+    filtros = {}
+    if "--de" in opcoes:
+        filtros["inicio"] = int(opcoes["--de"])
+    if "--ate" in opcoes:
+        filtros["fim"] = int(opcoes["--ate"])
+    if "--tipo" in opcoes:
+        filtros["tipo"] = opcoes["--tipo"]
+
+    termo = " ".join(args)
+    procurar(termo, int(opcoes.get("--pagina", 1)), **filtros)
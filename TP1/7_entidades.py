@@ -1,116 +1,221 @@
+import argparse
 import os
 import sqlite3
+import time
+from collections import deque
 import spacy
 from lxml import etree
+from cache_ner import CacheNER, modelo_id, spans
+from entidades import Entidades, normalizar
+from ingestao import Ingestao, atualizar_manifesto
 
-def extrair_campos(xml_path, nlp):
+MODELO = "pt_core_news_lg"
+
+NS = {
+    'oai': 'http://www.openarchives.org/OAI/2.0/',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'oai_dc': 'http://www.openarchives.org/OAI/2.0/oai_dc/'
+}
+
+def carregar_modelo(nome=MODELO):
+    # Só o NER é usado (doc.ents); tagger, parser, lemmatizer etc. ficam desligados
+    return spacy.load(nome, enable=["ner"])
+
+def extrair_campos(xml_path):
+    # Só a leitura do XML; o NER é feito em lote por extrair_entidades
     with open(xml_path, 'rb') as f:
         tree = etree.parse(f)
-        ns = {
-            'oai': 'http://www.openarchives.org/OAI/2.0/',
-            'dc': 'http://purl.org/dc/elements/1.1/',
-            'oai_dc': 'http://www.openarchives.org/OAI/2.0/oai_dc/'
-        }
-
-        titulo = tree.findtext('.//dc:title', namespaces=ns) or ""
-        assunto = tree.findtext('.//dc:subject', namespaces=ns) or ""
-        texto = f"{titulo}. {assunto}"
-
-        # spaCy NER
-        doc = nlp(texto)
-        pessoas = set()
-        lugares = set()
-        for ent in doc.ents:
-            if ent.label_ == "PER":
-                pessoas.add(ent.text)
-            elif ent.label_ == "LOC":
-                lugares.add(ent.text)
-
-        return {
-            'id': os.path.basename(xml_path),
-            'titulo': titulo,
-            'assunto': assunto,
-            'texto': texto,
-            'pessoas': ", ".join(sorted(pessoas)),
-            'lugares': ", ".join(sorted(lugares))
-        }
-
-def indexar_ficheiros(cur, nlp):
-    indexed = set(row[0] for row in cur.execute("SELECT id FROM documentos").fetchall())
-    for file in os.listdir("records"):
-        if file.endswith(".xml") and file not in indexed:
-            dados = extrair_campos(os.path.join("records", file), nlp)
-            cur.execute("""
-                INSERT INTO documentos (id, titulo, assunto, texto, pessoas, lugares)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (dados['id'], dados['titulo'], dados['assunto'], dados['texto'], dados['pessoas'], dados['lugares']))
-            
-            for pessoa in dados['pessoas'].split(", "):
-                if pessoa:
-                    cur.execute("INSERT INTO entidades (doc_id, nome, tipo) VALUES (?, ?, ?)",
-                                (dados['id'], pessoa, "pessoa"))
-            for lugar in dados['lugares'].split(", "):
-                if lugar:
-                    cur.execute("INSERT INTO entidades (doc_id, nome, tipo) VALUES (?, ?, ?)",
-                                (dados['id'], lugar, "lugar"))
-
-def setup():
-    nlp = spacy.load("pt_core_news_lg")
+
+    titulo = tree.findtext('.//dc:title', namespaces=NS) or ""
+    assunto = tree.findtext('.//dc:subject', namespaces=NS) or ""
+    return {
+        'id': os.path.basename(xml_path),
+        'titulo': titulo,
+        'assunto': assunto,
+        'texto': f"{titulo}. {assunto}"
+    }
+
+def com_entidades(dados, spans):
+    pessoas = set()
+    lugares = set()
+    for texto, etiqueta, _, _ in spans:
+        if etiqueta == "PER":
+            pessoas.add(texto)
+        elif etiqueta == "LOC":
+            lugares.add(texto)
+    dados['pessoas'] = sorted(pessoas)
+    dados['lugares'] = sorted(lugares)
+    return dados
+
+def extrair_entidades(nlp, campos, batch_size=256, n_process=1, cache=None):
+    """
+    Passa os textos por nlp.pipe em lotes de `batch_size` (e `n_process`
+    processos) e devolve, por documento, os campos com pessoas e lugares.
+    Com `cache` (CacheNER), os textos já vistos por este modelo não passam
+    pelo spaCy; a ordem dos resultados pode então diferir da de `campos`.
+    """
+    acertos = deque()
+
+    def falhas():
+        for c in campos:
+            encontrados = cache.obter(c['texto']) if cache is not None else None
+            if encontrados is None:
+                yield c['texto'], c
+            else:
+                acertos.append((c, encontrados))
+
+    # Só com cache é que os resultados novos ficam à espera de ser gravados, um lote de cada vez
+    novos = []
+    for doc, dados in nlp.pipe(falhas(), as_tuples=True, batch_size=batch_size, n_process=n_process):
+        encontrados = spans(doc)
+        yield com_entidades(dados, encontrados)
+        while acertos:
+            yield com_entidades(*acertos.popleft())
+        if cache is not None:
+            novos.append((dados['texto'], encontrados))
+            if len(novos) >= batch_size:
+                cache.guardar(novos)
+                novos = []
+    while acertos:
+        yield com_entidades(*acertos.popleft())
+    if cache is not None:
+        cache.guardar(novos)
+
+def guardar_lote(cur, indice, lote):
+    cur.executemany("INSERT INTO documentos_ner (id, titulo, assunto, texto) VALUES (?, ?, ?, ?)",
+                    ((d['id'], d['titulo'], d['assunto'], d['texto']) for d in lote))
+    indice.guardar((d['id'], [(p, "pessoa") for p in d['pessoas']] + [(l, "lugar") for l in d['lugares']])
+                   for d in lote)
+
+def indexar_ficheiros(cur, nlp, batch_size=256, n_process=1, lote=500, cache=None):
+    # Só os ficheiros novos ou alterados; os removidos saem do índice
+    manifesto = atualizar_manifesto("records")
+    ingestao = Ingestao(cur.connection, "entidades")
+    indice = Entidades(cur.connection)
+    pendentes, removidos = ingestao.delta(manifesto)
+    cur.executemany("DELETE FROM documentos_ner WHERE id = ?", ((f,) for f in removidos + pendentes))
+    indice.remover(removidos + pendentes)
+    ingestao.esquecer(removidos)
+
+    inicio = time.perf_counter()
+    campos = (extrair_campos(os.path.join("records", file)) for file in pendentes)
+    documentos = []
+    for dados in extrair_entidades(nlp, campos, batch_size, n_process, cache):
+        documentos.append(dados)
+        if len(documentos) == lote:
+            guardar_lote(cur, indice, documentos)
+            documentos = []
+    guardar_lote(cur, indice, documentos)
+    duracao = time.perf_counter() - inicio
+
+    ingestao.marcar((f, manifesto[f]) for f in pendentes)
+    print(f"{len(pendentes)} documentos novos/alterados, {len(removidos)} removidos, "
+          f"{len(manifesto) - len(pendentes)} inalterados.")
+    if pendentes:
+        print(f"NER: {len(pendentes) / max(duracao, 1e-9):.0f} docs/s "
+              f"({nlp.meta['name']} {nlp.meta['version']}, batch_size={batch_size}, "
+              f"n_process={n_process}, {os.cpu_count()} CPUs)")
+    if cache is not None:
+        print(cache.estatisticas())
+
+def setup(modelo=MODELO):
+    nlp = carregar_modelo(modelo)
+    conn, cur = abrir_db()
+    return nlp, conn, cur
+
+def abrir_db():
     conn = sqlite3.connect("arquivo.db")
     cur = conn.cursor()
-    
-    # Criar ou resetar as tabelas
-    cur.execute("DROP TABLE IF EXISTS documentos")
-    cur.execute("DROP TABLE IF EXISTS entidades")
 
+    # Bases de dados com pessoas/lugares em texto (documentos_ner.pessoas e a
+    # antiga tabela entidades(doc_id, nome, tipo)) são reconstruídas
+    colunas = {c[1] for c in cur.execute("PRAGMA table_info(documentos_ner)")}
+    if "pessoas" in colunas:
+        cur.execute("DROP TABLE documentos_ner")
+        cur.execute("DROP TABLE IF EXISTS entidades")
+        if cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'ingestao'").fetchone():
+            cur.execute("DELETE FROM ingestao WHERE etapa = 'entidades'")
+
+    # Criar as tabelas se ainda não existirem (a indexação é incremental).
+    # A tabela documentos pertence ao 6_procura.py, por isso aqui é documentos_ner;
+    # as pessoas e os lugares ficam no índice de entidades (entidades.py)
     cur.execute("""
-        CREATE TABLE documentos (
+        CREATE TABLE IF NOT EXISTS documentos_ner (
             id TEXT PRIMARY KEY,
             titulo TEXT,
             assunto TEXT,
-            texto TEXT,
-            pessoas TEXT,
-            lugares TEXT
-        )
-    """)
-    
-    cur.execute("""
-        CREATE TABLE entidades (
-            doc_id TEXT,
-            nome TEXT,
-            tipo TEXT
+            texto TEXT
         )
     """)
+    Entidades(conn)
 
-    return nlp, conn, cur
+    return conn, cur
 
 def close_db(conn):
     conn.commit()
     conn.close()
     
-def indexar(cur, nlp):
-    indexar_ficheiros(cur, nlp)
+def indexar(cur, nlp, batch_size=256, n_process=1, cache=None):
+    indexar_ficheiros(cur, nlp, batch_size, n_process, cache=cache)
     print("Indexação concluída")
 
-def pesquisar(query, cur):
-    res = cur.execute(query)
+def pesquisar(query, cur, params=()):
+    res = cur.execute(query, params)
     for doc_id, titulo, pessoas, lugares in res:
         print(f"Documento: {doc_id} - {titulo}")
+        # GROUP_CONCAT não garante a ordem
         if pessoas:
-            print(f"Pessoas: {pessoas}")
+            print(f"Pessoas: {', '.join(sorted(pessoas.split(', ')))}")
         if lugares:
-            print(f"Lugares: {lugares}")
+            print(f"Lugares: {', '.join(sorted(lugares.split(', ')))}")
         print()
 
+# Pessoas e lugares de cada documento, a partir das menções
+DOCUMENTOS = """
+    SELECT d.id, d.titulo,
+           GROUP_CONCAT(CASE WHEN e.tipo = 'pessoa' THEN e.nome END, ', '),
+           GROUP_CONCAT(CASE WHEN e.tipo = 'lugar' THEN e.nome END, ', ')
+    FROM documentos_ner d
+    JOIN mencoes m ON m.doc_id = d.id
+    JOIN entidades e ON e.id = m.entidade_id
+    {onde}
+    GROUP BY d.id
+    ORDER BY d.id
+"""
+
 def main():
+    # python3 7_entidades.py [--batch N] [--processos N] [--sem-cache] [--cache-max N] > entidades.txt
+    # python3 7_entidades.py --menciona NOME            documentos que mencionam NOME
+    # python3 7_entidades.py --lugares-com PESSOA       lugares mais mencionados com PESSOA
+    parser = argparse.ArgumentParser(description="Entidades mencionadas (pessoas e lugares) nos registos.")
+    parser.add_argument("--batch", type=int, default=256, help="textos por lote do nlp.pipe")
+    parser.add_argument("--processos", type=int, default=1, help="processos do nlp.pipe")
+    parser.add_argument("--sem-cache", action="store_true", help="não usar a cache do NER (ner_cache.db)")
+    parser.add_argument("--cache-max", type=int, default=500000, help="máximo de entradas na cache do NER")
+    parser.add_argument("--menciona", metavar="NOME", help="só os documentos que mencionam NOME (sem reindexar)")
+    parser.add_argument("--lugares-com", metavar="PESSOA", help="lugares mais mencionados com PESSOA (sem reindexar)")
+    args = parser.parse_args()
+
+    if args.menciona or args.lugares_com:
+        conn, cur = abrir_db()
+        if args.menciona:
+            pesquisar(DOCUMENTOS.format(onde="""
+                WHERE d.id IN (SELECT m.doc_id FROM entidades e JOIN mencoes m ON m.entidade_id = e.id
+                               WHERE e.chave = ?)"""), cur, (normalizar(args.menciona),))
+        else:
+            for lugar, n in Entidades(conn).coocorrencias(args.lugares_com):
+                print(f"{n:6}  {lugar}")
+        conn.close()
+        return
+
     nlp, conn, cur = setup()
-    indexar(cur, nlp)
+    if args.sem_cache:
+        indexar(cur, nlp, args.batch, args.processos)
+    else:
+        with CacheNER(modelo_id(nlp), max_entradas=args.cache_max) as cache:
+            indexar(cur, nlp, args.batch, args.processos, cache)
 
-    query = """
-        SELECT id, titulo, pessoas, lugares FROM documentos
-        WHERE pessoas != '' OR lugares != ''
-    """
-    pesquisar(query, cur)
+    pesquisar(DOCUMENTOS.format(onde=""), cur)
     close_db(conn)
 
 if __name__ == "__main__":
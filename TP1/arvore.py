@@ -0,0 +1,241 @@
+"""Árvore arquivística (fundo > secção > ... > documento) partilhada por 3_arvore_arq.py e 4_arvore_dir.py.
+
+A árvore é construída a partir dos códigos de referência PT/... dos
+registos, criando também os nós intermédios que não têm registo próprio.
+Cada código é percorrido do fim para o início só até encontrar um
+antepassado que já existe, por isso a construção é linear no número de nós.
+Os filhos ficam ordenados por id uma única vez, no fim da construção.
+
+    nodes = arvore_de_registos()          # {full_id: ArchivalNode}
+    for root in raizes(nodes): ...
+
+Os formatos de saída (texto, wiki, HTML, Markdown) são emissores sobre um
+único percurso iterativo da árvore (`renderizar`), que vai produzindo o
+texto aos bocados; `escrita.escrever` grava-os num ficheiro com um buffer grande:
+
+    escrever(renderizar(raizes(nodes), EmissorWiki()), "output/wiki.txt")
+
+A árvore construída é guardada ao lado do armazém de registos
+(`registos.arvore.json`, com os nós em pré-ordem) e reutilizada enquanto o
+armazém não mudar.
+"""
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from registos import DB_REGISTOS, Registos, codigo_referencia
+
+# Tipo de cada nível, quando o registo não o indica
+TIPOS_POR_NIVEL = {1: 'F', 2: 'SC', 3: 'SSC', 4: 'SR', 5: 'UI'}
+
+
+class ArchivalNode:
+    __slots__ = ("id", "title", "tipo", "full_id", "parent_id", "children")
+
+    def __init__(self, id: str, title: str, tipo: Optional[str], full_id: str, parent_id: Optional[str] = None,
+                 children: Optional[List['ArchivalNode']] = None):
+        self.id = id
+        self.title = title
+        self.tipo = tipo
+        self.full_id = full_id
+        self.parent_id = parent_id
+        self.children = children if children is not None else []
+
+    def __repr__(self, level=0):
+        return "".join(renderizar([self], EmissorTexto(), level))
+
+
+def inferir_tipo(nivel: int, node_id: str) -> Optional[str]:
+    """Tipo de um nó sem registo (ou com registo sem tipo), pela profundidade; abaixo do nível 6 fica sem tipo."""
+    if nivel in TIPOS_POR_NIVEL:
+        return TIPOS_POR_NIVEL[nivel]
+    if nivel == 6:
+        # Documentos compostos têm códigos do tipo 006-003
+        return 'DC' if '-' in node_id else 'D'
+    return None
+
+
+def tipo_por_omissao(nodes: Dict[str, ArchivalNode], tipo: str = 'UI') -> Dict[str, ArchivalNode]:
+    """Dá `tipo` aos nós que ficaram sem tipo, como 4_arvore_dir.py sempre fez (3_arvore_arq.py deixa-os sem)."""
+    for node in nodes.values():
+        if node.tipo is None:
+            node.tipo = tipo
+    return nodes
+
+
+def construir_arvore(records: Iterable[dict]) -> Dict[str, ArchivalNode]:
+    """Constrói {full_id: ArchivalNode} com todos os nós, incluindo os intermédios sem registo."""
+    records_by_id = {}
+    for record in records:
+        full_id = codigo_referencia(record)
+        if full_id:
+            records_by_id[full_id] = record
+
+    nodes = {}
+    for full_id in records_by_id:
+        child = None
+        sub_id = full_id
+        # Sobe na cadeia até encontrar um nó que já existe (e, com ele, todos os seus antepassados)
+        while sub_id not in nodes:
+            parent_id, _, node_id = sub_id.rpartition("/")
+            record = records_by_id.get(sub_id, {})
+            tipo = record.get("tipo")
+            if tipo is None:
+                tipo = inferir_tipo(sub_id.count("/") + 1, node_id)
+            node = nodes[sub_id] = ArchivalNode(node_id, record.get("titulo", f"({node_id})"), tipo, sub_id,
+                                                parent_id or None)
+            if child is not None:
+                node.children.append(child)
+            child = node
+            if not parent_id:
+                break
+            sub_id = parent_id
+        else:
+            if child is not None:
+                nodes[sub_id].children.append(child)
+
+    for node in nodes.values():
+        node.children.sort(key=lambda n: n.id)
+    return nodes
+
+
+def raizes(nodes: Dict[str, ArchivalNode]) -> List[ArchivalNode]:
+    """Nós de topo (fundos), ordenados por id."""
+    return sorted((n for n in nodes.values() if n.parent_id not in nodes), key=lambda n: n.id)
+
+
+def guardar_arvore(nodes: Dict[str, ArchivalNode], path: str):
+    """Guarda a árvore como lista [full_id, título, tipo] em pré-ordem."""
+    linhas = []
+    pilha = raizes(nodes)[::-1]
+    while pilha:
+        node = pilha.pop()
+        linhas.append((node.full_id, node.title, node.tipo))
+        pilha.extend(reversed(node.children))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(linhas, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def carregar_arvore(path: str) -> Dict[str, ArchivalNode]:
+    """Lê uma árvore guardada por guardar_arvore; a pré-ordem já traz os filhos ordenados."""
+    with open(path, encoding="utf-8") as f:
+        linhas = json.load(f)
+    nodes = {}
+    for full_id, title, tipo in linhas:
+        parent_id, _, node_id = full_id.rpartition("/")
+        node = nodes[full_id] = ArchivalNode(node_id, title, tipo, full_id, parent_id or None)
+        if parent_id in nodes:
+            nodes[parent_id].children.append(node)
+    return nodes
+
+
+def arvore_de_registos(db: str = DB_REGISTOS, path: Optional[str] = None) -> Dict[str, ArchivalNode]:
+    """Árvore dos registos em `db`, lida de `path` (por omissão <db>.arvore.json) se for mais recente do que `db`."""
+    path = path or f"{os.path.splitext(db)[0]}.arvore.json"
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(db):
+        return carregar_arvore(path)
+    with Registos(db) as store:
+        nodes = construir_arvore(store)
+    guardar_arvore(nodes, path)
+    return nodes
+
+
+class Emissor:
+    """
+    Formato de saída: as linhas de cada nó, ao abrir (antes dos filhos) e ao
+    fechar (depois dos filhos), e as linhas de cabeçalho/rodapé. Com
+    `separador`, as linhas são unidas por "\\n" (sem "\\n" no fim); sem ele,
+    cada linha termina em "\\n".
+    """
+    separador = False
+    cabecalho = ()
+    rodape = ()
+
+    def abrir(self, node: ArchivalNode, nivel: int) -> Iterable[str]:
+        return ()
+
+    def fechar(self, node: ArchivalNode, nivel: int) -> Iterable[str]:
+        return ()
+
+
+class EmissorTexto(Emissor):
+    def abrir(self, node, nivel):
+        tipo_label = f" [{node.tipo}]" if node.tipo else ""
+        return ("\t" * nivel + f"{node.id}{tipo_label} - {node.title}",)
+
+
+class EmissorWiki(Emissor):
+    separador = True
+    cabecalho = ("== Árvore Arquivística ==\n", "Lista de todos os nós e seus identificadores:\n")
+
+    def abrir(self, node, nivel):
+        # Indenta conforme o nível da árvore, sem links
+        return ('    ' * nivel + f"* {node.id} - {node.tipo} - {node.title}",)
+
+
+class EmissorHTML(Emissor):
+    """Lista <ul> encaixada; `files` ({full_id: ficheiro}) liga os nós aos ficheiros em `record_dir`."""
+    separador = True
+    cabecalho = ("<html><head><meta charset='UTF-8'><title>Árvore Arquivística</title></head><body>",
+                 "<h1>Árvore Arquivística</h1>",
+                 "<ul>")
+    rodape = ("</ul>", "</body></html>")
+
+    def __init__(self, record_dir: str = "", files: Optional[Dict[str, str]] = None):
+        self.record_dir = record_dir
+        self.files = files or {}
+
+    def abrir(self, node, nivel):
+        label = f"{node.id}-{node.tipo}-{node.title}".replace("/", "_")
+        filename = self.files.get(node.full_id)
+        if filename:
+            label = f'<a href="../{self.record_dir}/{filename}">{label}</a>'
+        return (f"<li>{label}", "<ul>") if node.children else (f"<li>{label}",)
+
+    def fechar(self, node, nivel):
+        return ("</ul>", "</li>") if node.children else ("</li>",)
+
+
+class EmissorMarkdown(Emissor):
+    cabecalho = ("# Árvore Arquivística", "")
+
+    def __init__(self, record_dir: str = "", files: Optional[Dict[str, str]] = None):
+        self.record_dir = record_dir
+        self.files = files or {}
+
+    def abrir(self, node, nivel):
+        titulo = node.title.replace("[", "\\[").replace("]", "\\]")
+        filename = self.files.get(node.full_id)
+        if filename:
+            titulo = f"[{titulo}]({self.record_dir}/{filename})"
+        return ("  " * nivel + f"- **{node.id}** ({node.tipo}) {titulo}",)
+
+
+def _linhas(roots: Iterable[ArchivalNode], emissor: Emissor, nivel: int) -> Iterator[str]:
+    yield from emissor.cabecalho
+    # Pilha explícita (sem recursão): (nó, nível, a fechar?)
+    pilha = [(root, nivel, False) for root in reversed(list(roots))]
+    while pilha:
+        node, n, fechar = pilha.pop()
+        if fechar:
+            yield from emissor.fechar(node, n)
+            continue
+        yield from emissor.abrir(node, n)
+        pilha.append((node, n, True))
+        pilha.extend((child, n + 1, False) for child in reversed(node.children))
+    yield from emissor.rodape
+
+
+def renderizar(roots: Iterable[ArchivalNode], emissor: Emissor, nivel: int = 0) -> Iterator[str]:
+    """Texto das subárvores `roots` no formato do `emissor`, aos bocados."""
+    linhas = _linhas(roots, emissor, nivel)
+    if not emissor.separador:
+        for linha in linhas:
+            yield linha + "\n"
+        return
+    primeira = next(linhas, None)
+    if primeira is None:
+        return
+    yield primeira
+    for linha in linhas:
+        yield "\n" + linha
@@ -0,0 +1,520 @@
+"""Benchmarks offline das etapas do TP1.
+
+    python3 benchmark.py recolha [n_registos]
+    python3 benchmark.py estrutura [n_registos]
+    python3 benchmark.py registos [n_registos]
+    python3 benchmark.py incremental [n_registos]
+    python3 benchmark.py arvore [n_registos]
+    python3 benchmark.py html [n_registos]
+    python3 benchmark.py render [n_registos]
+    python3 benchmark.py diretorias [n_registos]
+    python3 benchmark.py site [n_registos]
+    python3 benchmark.py indice [n_registos]
+    python3 benchmark.py pesquisa [n_registos]
+    python3 benchmark.py entidades [n_registos]
+    python3 benchmark.py mencoes [n_documentos]
+    python3 benchmark.py brutos [n_registos]
+
+Cada benchmark usa o servidor OAI-PMH falso (fake_oai.py) e diretorias
+temporárias, por isso não precisa de rede nem toca nos dados reais.
+"""
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+from fake_oai import FakeOAIServer
+
+
+def etapa(nome):
+    """Importa uma das scripts numeradas (ex: "2_estrutura")."""
+    return importlib.import_module(nome)
+
+
+def gerar_records(directory, n_registos):
+    """Descarrega `n_registos` sintéticos do servidor falso para `directory`."""
+    import recolha
+
+    with FakeOAIServer(n_registos, por_pagina=500) as servidor:
+        recolha.recolher(servidor.url, directory, workers=1, taxa=10000)
+
+
+def bench_recolha(n_registos=5000):
+    import recolha
+
+    latencia = 0.02
+    with tempfile.TemporaryDirectory() as tmp:
+        # Sequencial, uma só partição (equivalente ao antigo ciclo)
+        with FakeOAIServer(n_registos, sets=4, latencia=latencia) as servidor:
+            inicio = time.perf_counter()
+            recolha.recolher(servidor.url, os.path.join(tmp, "seq"), workers=1, taxa=1000)
+            seq = time.perf_counter() - inicio
+
+        # Por set, 4 partições em paralelo
+        with FakeOAIServer(n_registos, sets=4, latencia=latencia) as servidor:
+            inicio = time.perf_counter()
+            recolha.recolher(servidor.url, os.path.join(tmp, "par"), sets="todos", workers=4, taxa=1000)
+            par = time.perf_counter() - inicio
+
+        # Retoma: o servidor falha a meio, a segunda execução continua do checkpoint
+        directory = os.path.join(tmp, "retoma")
+        paginas_total = -(-n_registos // 100)
+        with FakeOAIServer(n_registos, sets=4, falhar_apos=paginas_total // 2) as servidor:
+            try:
+                recolha.recolher(servidor.url, directory, workers=1, taxa=1000)
+            except Exception as e:
+                print(f"Recolha interrompida: {e.__class__.__name__}")
+        with FakeOAIServer(n_registos, sets=4) as servidor:
+            recolha.recolher(servidor.url, directory, workers=1, taxa=1000)
+            retomadas = servidor.paginas_servidas
+        ficheiros = len([f for f in os.listdir(directory) if f.endswith(".xml")])
+
+    print(f"\nsequencial: {seq:.2f}s ({n_registos / seq:.0f} registos/s)")
+    print(f"paralelo (4 sets, 4 workers): {par:.2f}s ({n_registos / par:.0f} registos/s)")
+    print(f"retoma: {retomadas} de {paginas_total} páginas pedidas na segunda execução, {ficheiros} ficheiros")
+
+
+def bench_estrutura(n_registos=30920):
+    estrutura = etapa("2_estrutura")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        records = os.path.join(tmp, "records")
+        gerar_records(records, n_registos)
+        resultados = []
+        for workers in (1, None):
+            inicio = time.perf_counter()
+            estrutura.save_records(records, os.path.join(tmp, f"registos_{workers}.db"), workers=workers)
+            resultados.append((workers or os.cpu_count(), time.perf_counter() - inicio))
+
+    print()
+    for workers, duracao in resultados:
+        print(f"{workers} processo(s): {duracao:.2f}s ({n_registos / duracao:.0f} registos/s)")
+
+
+def bench_registos(n_registos=30920):
+    from registos import Registos
+    estrutura = etapa("2_estrutura")
+    arvore = etapa("4_arvore_dir")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        records, db, yaml_dir = (os.path.join(tmp, d) for d in ("records", "registos.db", "records_yaml"))
+        gerar_records(records, n_registos)
+        estrutura.save_records(records, db)
+        with Registos(db) as store:
+            store.exportar_yaml(yaml_dir)
+
+            inicio = time.perf_counter()
+            store.get(f"PT/MVNF/AMAS/CSC/000/{n_registos // 2:06d}")
+            acesso = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        nos_yaml = arvore.load_yaml_records(yaml_dir)
+        t_yaml = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        nos_db = arvore.load_records(db)
+        t_db = time.perf_counter() - inicio
+
+    print(f"\nárvore a partir de {n_registos} YAML: {t_yaml:.2f}s ({len(nos_yaml)} nós)")
+    print(f"árvore a partir de registos.db: {t_db:.2f}s ({len(nos_db)} nós)")
+    print(f"acesso direto por código PT/...: {acesso * 1000:.2f}ms")
+
+
+def bench_incremental(n_registos=30920):
+    estrutura = etapa("2_estrutura")
+    procura = etapa("6_procura")
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        gerar_records(os.path.join(tmp, "records"), n_registos)
+        os.chdir(tmp)
+        try:
+            def correr():
+                inicio = time.perf_counter()
+                estrutura.save_records()
+                procura.criar_db()
+                procura.inserir_dados()
+                return time.perf_counter() - inicio
+
+            completo = correr()
+            # Delta OAI: 50 registos alterados e 10 apagados
+            ficheiros = sorted(f for f in os.listdir("records") if f.endswith(".xml"))
+            for f in ficheiros[:50]:
+                path = os.path.join("records", f)
+                with open(path, encoding="utf-8") as fh:
+                    xml = fh.read()
+                with open(path, "w", encoding="utf-8") as fh:
+                    fh.write(xml.replace("Documento", "Documento revisto", 1))
+            for f in ficheiros[50:60]:
+                os.remove(os.path.join("records", f))
+            delta = correr()
+            sem_alteracoes = correr()
+        finally:
+            os.chdir(cwd)
+
+    print(f"\nconstrução completa: {completo:.2f}s")
+    print(f"após delta (50 alterados, 10 apagados): {delta:.2f}s")
+    print(f"sem alterações: {sem_alteracoes:.2f}s")
+
+
+def bench_arvore(n_registos=30920):
+    import tracemalloc
+    import arvore
+    from registos import Registos
+    estrutura = etapa("2_estrutura")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        records, db = os.path.join(tmp, "records"), os.path.join(tmp, "registos.db")
+        gerar_records(records, n_registos)
+        estrutura.save_records(records, db)
+        with Registos(db) as store:
+            registos = list(store)
+
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        nodes = arvore.construir_arvore(registos)
+        construcao = time.perf_counter() - inicio
+        memoria = tracemalloc.get_traced_memory()[0] / 2**20
+        tracemalloc.stop()
+
+        path = os.path.join(tmp, "registos.arvore.json")
+        arvore.guardar_arvore(nodes, path)
+        inicio = time.perf_counter()
+        arvore.carregar_arvore(path)
+        leitura = time.perf_counter() - inicio
+        tamanho = os.path.getsize(path) / 2**20
+
+    print(f"\nárvore de {n_registos} registos ({len(nodes)} nós): construída em {construcao:.2f}s, "
+          f"{memoria:.1f}MB em memória")
+    print(f"lida de {os.path.basename(path)} ({tamanho:.1f}MB) em {leitura:.2f}s")
+
+
+def bench_html(n_registos=30920):
+    from registos import Registos
+    estrutura = etapa("2_estrutura")
+    arvore = etapa("4_arvore_dir")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        records, db, yaml_dir = (os.path.join(tmp, d) for d in ("records", "registos.db", "records_yaml"))
+        gerar_records(records, n_registos)
+        estrutura.save_records(records, db)
+        with Registos(db) as store:
+            store.exportar_yaml(yaml_dir)
+        html = os.path.join(tmp, "html_arvore", "index.html")
+
+        # A partir dos YAML: uma leitura de cada ficheiro dá a árvore e o índice código -> ficheiro
+        inicio = time.perf_counter()
+        nodes, files = arvore.load_yaml_records_and_files(yaml_dir)
+        arvore.generate_html_tree_with_links(nodes, html, yaml_dir, files)
+        t_yaml = time.perf_counter() - inicio
+
+        # A partir do armazém, como em 4_arvore_dir.py
+        inicio = time.perf_counter()
+        nodes = arvore.load_records(db)
+        arvore.generate_html_tree_with_links(nodes, html, yaml_dir, arvore.yaml_files(db))
+        t_db = time.perf_counter() - inicio
+        tamanho = os.path.getsize(html) / 2**20
+
+    print(f"\nHTML da árvore de {n_registos} registos ({len(nodes)} nós, {tamanho:.1f}MB):")
+    print(f"a partir dos YAML: {t_yaml:.2f}s")
+    print(f"a partir de registos.db: {t_db:.2f}s")
+
+
+def bench_render(n_registos=30920):
+    import tracemalloc
+    import arvore
+    from escrita import escrever
+    estrutura = etapa("2_estrutura")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        records, db = os.path.join(tmp, "records"), os.path.join(tmp, "registos.db")
+        gerar_records(records, n_registos)
+        estrutura.save_records(records, db)
+        nodes = arvore.arvore_de_registos(db)
+        roots = arvore.raizes(nodes)
+
+        resultados = []
+        for nome, emissor in (("texto", arvore.EmissorTexto()), ("wiki", arvore.EmissorWiki()),
+                              ("html", arvore.EmissorHTML()), ("markdown", arvore.EmissorMarkdown())):
+            path = os.path.join(tmp, "output", nome)
+            tracemalloc.start()
+            inicio = time.perf_counter()
+            escrever(arvore.renderizar(roots, emissor), path)
+            duracao = time.perf_counter() - inicio
+            pico = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            resultados.append((nome, duracao, pico, os.path.getsize(path) / 2**20))
+
+    print(f"\n{'formato':<10}{'segundos':>10}{'pico (MB)':>12}{'ficheiro (MB)':>15}")
+    for nome, duracao, pico, tamanho in resultados:
+        print(f"{nome:<10}{duracao:>10.2f}{pico:>12.1f}{tamanho:>15.1f}")
+
+
+def bench_diretorias(n_registos=30920):
+    import arvore
+    estrutura = etapa("2_estrutura")
+    arvore_dir = etapa("4_arvore_dir")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        records, db = os.path.join(tmp, "records"), os.path.join(tmp, "registos.db")
+        gerar_records(records, n_registos)
+        estrutura.save_records(records, db)
+        nodes = arvore.arvore_de_registos(db)
+
+        resultados = []
+        for workers in (1, 16):
+            inicio = time.perf_counter()
+            arvore_dir.generate_directory_structure(nodes, os.path.join(tmp, f"arvore_{workers}"), workers=workers)
+            resultados.append((f"diretorias, {workers} thread(s)", time.perf_counter() - inicio))
+
+        base = os.path.join(tmp, "arvore_16")
+        arvore_dir.generate_directory_structure(nodes, base, incremental=True)
+        nodes[next(iter(nodes))].title = "Fundo renomeado"
+        inicio = time.perf_counter()
+        escritos = arvore_dir.generate_directory_structure(nodes, base, incremental=True)
+        resultados.append((f"incremental ({escritos} nós alterados)", time.perf_counter() - inicio))
+
+        for extensao in ("tar", "zip"):
+            inicio = time.perf_counter()
+            arvore_dir.export_directory_archive(nodes, os.path.join(tmp, f"arvore.{extensao}"))
+            resultados.append((f"arquivo .{extensao}", time.perf_counter() - inicio))
+
+    print(f"\n{len(nodes)} nós:")
+    for descricao, duracao in resultados:
+        print(f"{descricao}: {duracao:.2f}s")
+
+
+def bench_site(n_registos=30920):
+    site_estatico = etapa("site_estatico")
+    estrutura = etapa("2_estrutura")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        records, db, output = (os.path.join(tmp, d) for d in ("records", "registos.db", "site"))
+        gerar_records(records, n_registos)
+        estrutura.save_records(records, db)
+        inicio = time.perf_counter()
+        n = site_estatico.gerar_site(db, output)
+        duracao = time.perf_counter() - inicio
+        tamanhos = {}
+        for raiz, _, ficheiros in os.walk(output):
+            for f in ficheiros:
+                tamanhos[os.path.relpath(os.path.join(raiz, f), output)] = os.path.getsize(os.path.join(raiz, f))
+
+    maior = max(tamanhos, key=tamanhos.get)
+    paginas = [t for f, t in tamanhos.items() if f.endswith(".html")]
+    print(f"\nsite de {n_registos} registos: {n} ficheiros em {duracao:.2f}s, {sum(tamanhos.values()) / 2**20:.1f}MB")
+    print(f"index.html: {tamanhos['index.html'] / 1024:.1f}KB; maior página HTML: {max(paginas) / 1024:.1f}KB; "
+          f"maior ficheiro: {maior} ({tamanhos[maior] / 1024:.1f}KB)")
+
+
+def bench_indice(n_registos=30920):
+    procura = etapa("6_procura")
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        gerar_records(os.path.join(tmp, "records"), n_registos)
+        os.chdir(tmp)
+        try:
+            procura.criar_db(reset=True)
+            inicio = time.perf_counter()
+            procura.inserir_dados()
+            duracao = time.perf_counter() - inicio
+        finally:
+            os.chdir(cwd)
+
+    print(f"\níndice FTS5 de {n_registos} registos: {duracao:.2f}s")
+
+
+def construir_indice(tmp, n_registos):
+    """Registos sintéticos + índice FTS em `tmp` (que passa a ser a diretoria atual)."""
+    procura = etapa("6_procura")
+    gerar_records(os.path.join(tmp, "records"), n_registos)
+    os.chdir(tmp)
+    procura.criar_db(reset=True)
+    procura.inserir_dados()
+
+
+def bench_pesquisa(n_registos=30920):
+    from pesquisa import Pesquisa
+
+    termos = ["fotografia*", "carta", "documento", "Braga OR Famalicão", "\"casa de pindela\"", "batismo", "fundo"]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            construir_indice(tmp, n_registos)
+            with Pesquisa() as p:
+                for _ in range(50):
+                    for termo in termos:
+                        pagina = p.procurar(termo, limite=20)
+                        if pagina:
+                            p.procurar(termo, limite=20, depois=pagina[-1])
+                        p.procurar(termo, limite=20, offset=200)
+                p50, p99 = p.percentis(50, 99)
+                n = len(p.latencias)
+
+                # Texto + filtros estruturados, e só sobreposição de intervalos
+                p.latencias = []
+                for _ in range(50):
+                    for termo in termos:
+                        p.procurar(termo, limite=20, inicio=1876, fim=1914)
+                        p.procurar(termo, limite=20, inicio=1876, fim=1914, tipo="UI")
+                f50, f99 = p.percentis(50, 99)
+                p.latencias = []
+                for ano in range(1700, 2000, 3):
+                    p.filtrar(ano, ano + 10)
+                i50, i99 = p.percentis(50, 99)
+        finally:
+            os.chdir(cwd)
+
+    print(f"\n{n} pesquisas sobre {n_registos} registos: p50 {p50:.2f}ms, p99 {p99:.2f}ms")
+    print(f"com filtros de data/tipo: p50 {f50:.2f}ms, p99 {f99:.2f}ms")
+    print(f"só sobreposição de intervalos: p50 {i50:.2f}ms, p99 {i99:.2f}ms")
+
+
+def bench_entidades(n_registos=2000):
+    # Precisa do spaCy e do modelo pt_core_news_lg instalados
+    import spacy
+    entidades = etapa("7_entidades")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        records = os.path.join(tmp, "records")
+        gerar_records(records, n_registos)
+        campos = [entidades.extrair_campos(os.path.join(records, f))
+                  for f in sorted(os.listdir(records)) if f.endswith(".xml")]
+
+    resultados = []
+    # Como antes: pipeline completo, um nlp(texto) por documento
+    nlp = spacy.load(entidades.MODELO)
+    inicio = time.perf_counter()
+    for c in campos:
+        nlp(c['texto'])
+    resultados.append(("nlp(texto), pipeline completo", time.perf_counter() - inicio))
+
+    nlp = entidades.carregar_modelo()
+    for batch_size in (64, 256, 1024):
+        for n_process in sorted({1, os.cpu_count()}):
+            inicio = time.perf_counter()
+            for _ in entidades.extrair_entidades(nlp, [dict(c) for c in campos], batch_size, n_process):
+                pass
+            resultados.append((f"nlp.pipe, só NER, batch_size={batch_size}, n_process={n_process}",
+                               time.perf_counter() - inicio))
+
+    # Cache do NER: primeira passagem (só falhas) e depois de reconstruir a base de dados (só acertos)
+    from cache_ner import CacheNER, modelo_id
+    with tempfile.TemporaryDirectory() as tmp:
+        for passagem in ("fria", "quente"):
+            with CacheNER(modelo_id(nlp), os.path.join(tmp, "ner_cache.db")) as cache:
+                inicio = time.perf_counter()
+                for _ in entidades.extrair_entidades(nlp, [dict(c) for c in campos], cache=cache):
+                    pass
+                resultados.append((f"nlp.pipe com cache {passagem} ({cache.estatisticas()})",
+                                   time.perf_counter() - inicio))
+
+    print(f"\n{len(campos)} documentos, {os.cpu_count()} CPUs, {nlp.meta['name']} {nlp.meta['version']}")
+    for descricao, duracao in resultados:
+        print(f"{descricao}: {duracao:.2f}s ({len(campos) / duracao:.0f} docs/s)")
+
+
+def bench_mencoes(n_documentos=30920):
+    import random
+    import sqlite3
+    from entidades import Entidades
+
+    # Menções sintéticas (sem spaCy): 2-4 pessoas e 1-2 lugares por documento
+    rng = random.Random(0)
+    nomes = ["António", "João", "Maria", "José", "Inês", "Gonçalo", "Luísa", "Francisco"]
+    apelidos = ["Vaz Vieira", "Pereira de Sousa", "Gonçalves", "Araújo", "Simões", "Magalhães", "Brandão"]
+    pessoas = [f"{n} {a}" for n in nomes for a in apelidos] * 20
+    pessoas = [f"{p} {i // len(nomes * 7)}" if i >= len(nomes) * 7 else p for i, p in enumerate(pessoas)]
+    lugares = ["Braga", "Famalicão", "Guimarães", "Ribeirão", "São Tiago de Antas", "Landim", "Porto", "Lisboa"]
+
+    with tempfile.TemporaryDirectory() as tmp, sqlite3.connect(os.path.join(tmp, "arquivo.db")) as conn:
+        indice = Entidades(conn)
+        inicio = time.perf_counter()
+        lote = []
+        for i in range(n_documentos):
+            entidades = [(p, "pessoa") for p in rng.sample(pessoas, rng.randint(2, 4))]
+            entidades += [(l, "lugar") for l in rng.sample(lugares, rng.randint(1, 2))]
+            lote.append((f"record_{i}.xml", entidades))
+            if len(lote) == 500:
+                indice.guardar(lote)
+                lote = []
+        indice.guardar(lote)
+        conn.commit()
+        insercao = time.perf_counter() - inicio
+
+        latencias = []
+        for pessoa in rng.sample(pessoas, 200):
+            inicio = time.perf_counter()
+            indice.documentos(pessoa.upper().replace("ã", "a"))
+            indice.coocorrencias(pessoa, tipo="lugar")
+            latencias.append(time.perf_counter() - inicio)
+        latencias.sort()
+        n_entidades = conn.execute("SELECT COUNT(*) FROM entidades").fetchone()[0]
+        n_mencoes = conn.execute("SELECT COUNT(*) FROM mencoes").fetchone()[0]
+
+    print(f"\n{n_mencoes} menções de {n_entidades} entidades em {n_documentos} documentos: "
+          f"inseridas em {insercao:.2f}s")
+    print(f"documentos(X) + coocorrencias(X): p50 {latencias[len(latencias) // 2] * 1000:.2f}ms, "
+          f"p99 {latencias[int(len(latencias) * 0.99)] * 1000:.2f}ms")
+
+
+def bench_brutos(n_registos=30920):
+    import contextlib
+    import copy
+    import io
+    import get_data
+
+    # Os registos de dados_brutos.yaml repetidos até n_registos
+    amostra = get_data.load_data()["Registos"]
+    dados = {"Registos": [copy.deepcopy(amostra[i % len(amostra)]) for i in range(n_registos)]}
+    get_data.normalize_dates(dados)
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        for formato in ("html", "wiki", "yaml"):
+            path = os.path.join(tmp, f"registos.{formato}")
+            inicio = time.perf_counter()
+            get_data.save_records(dados["Registos"], path, formato)
+            duracao = time.perf_counter() - inicio
+            resultados.append((formato, duracao, os.path.getsize(path) / 2**20))
+
+        # Como o antigo ciclo: o ficheiro todo é reescrito por cada registo com data (só os primeiros 200)
+        n_antigo = min(200, n_registos)
+        html = os.path.join(tmp, "antigo.html")
+        inicio = time.perf_counter()
+        for registo in dados["Registos"][:n_antigo]:
+            if 'date' in registo:
+                get_data.save_records_html(dados["Registos"][:n_antigo], html)
+        antigo = time.perf_counter() - inicio
+
+    print(f"\n{n_registos} registos de dados_brutos.yaml")
+    print(f"{'formato':<10}{'segundos':>10}{'registos/s':>12}{'ficheiro (MB)':>15}")
+    for formato, duracao, tamanho in resultados:
+        print(f"{formato:<10}{duracao:>10.2f}{n_registos / max(duracao, 1e-9):>12.0f}{tamanho:>15.1f}")
+    print(f"HTML reescrito por registo, só {n_antigo} registos: {antigo:.2f}s")
+
+
+BENCHMARKS = {
+    "recolha": bench_recolha,
+    "estrutura": bench_estrutura,
+    "registos": bench_registos,
+    "incremental": bench_incremental,
+    "arvore": bench_arvore,
+    "html": bench_html,
+    "render": bench_render,
+    "diretorias": bench_diretorias,
+    "site": bench_site,
+    "indice": bench_indice,
+    "pesquisa": bench_pesquisa,
+    "entidades": bench_entidades,
+    "mencoes": bench_mencoes,
+    "brutos": bench_brutos,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"uso: python3 benchmark.py {{{','.join(BENCHMARKS)}}} [n_registos]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*(int(a) for a in sys.argv[2:]))
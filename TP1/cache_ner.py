@@ -0,0 +1,107 @@
+"""Cache persistente dos resultados do NER (ner_cache.db).
+
+Cada entrada é indexada pelo hash do texto e pelo modelo spaCy que a
+produziu (nome e versão), e guarda as entidades encontradas como
+(texto, etiqueta, início, fim). Como vive fora de arquivo.db, apagar ou
+reconstruir as tabelas de 7_entidades.py não obriga a correr o modelo outra
+vez: só os textos novos, ou um modelo diferente, falham a cache.
+
+    with CacheNER(modelo_id(nlp)) as cache:
+        spans = cache.obter(texto)        # None se não estiver na cache
+        cache.guardar([(texto, spans)])
+
+O tamanho é limitado a `max_entradas`; ao fechar, as entradas usadas há
+mais tempo são removidas (LRU).
+"""
+import hashlib
+import json
+import sqlite3
+import time
+
+CACHE_NER = "ner_cache.db"
+
+
+def modelo_id(nlp):
+    """Identifica o modelo, ex: pt_core_news_lg-3.7.0."""
+    return f"{nlp.meta['lang']}_{nlp.meta['name']}-{nlp.meta['version']}"
+
+
+def spans(doc):
+    """Entidades de um Doc do spaCy como lista de (texto, etiqueta, início, fim)."""
+    return [(ent.text, ent.label_, ent.start_char, ent.end_char) for ent in doc.ents]
+
+
+class CacheNER:
+    def __init__(self, modelo, path=CACHE_NER, max_entradas=500000):
+        self.modelo = modelo
+        self.max_entradas = max_entradas
+        self.acertos = 0
+        self.falhas = 0
+        self._usados = []
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ner (
+                modelo TEXT,
+                hash TEXT,
+                spans TEXT NOT NULL,
+                usado REAL,
+                PRIMARY KEY (modelo, hash)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ner_usado ON ner(usado)")
+
+    @staticmethod
+    def _hash(texto):
+        return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+    def obter(self, texto):
+        """Entidades de `texto` já calculadas com este modelo, ou None."""
+        chave = self._hash(texto)
+        row = self.conn.execute("SELECT spans FROM ner WHERE modelo = ? AND hash = ?",
+                                (self.modelo, chave)).fetchone()
+        if row is None:
+            self.falhas += 1
+            return None
+        self.acertos += 1
+        self._usados.append(chave)
+        return [tuple(s) for s in json.loads(row[0])]
+
+    def guardar(self, pares):
+        """Guarda pares (texto, spans) numa só transação."""
+        agora = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO ner (modelo, hash, spans, usado) VALUES (?, ?, ?, ?)",
+                ((self.modelo, self._hash(texto), json.dumps(s, ensure_ascii=False), agora) for texto, s in pares))
+
+    def limitar(self):
+        """Atualiza a data de uso das entradas lidas e remove as mais antigas acima de max_entradas."""
+        agora = time.time()
+        with self.conn:
+            self.conn.executemany("UPDATE ner SET usado = ? WHERE modelo = ? AND hash = ?",
+                                  ((agora, self.modelo, h) for h in self._usados))
+            self._usados = []
+            excesso = len(self) - self.max_entradas
+            if excesso > 0:
+                self.conn.execute("""
+                    DELETE FROM ner WHERE (modelo, hash) IN (
+                        SELECT modelo, hash FROM ner ORDER BY usado LIMIT ?)
+                """, (excesso,))
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        taxa = 100 * self.acertos / total if total else 0
+        return f"cache NER: {self.acertos} acertos, {self.falhas} falhas ({taxa:.0f}%), {len(self)} entradas"
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM ner").fetchone()[0]
+
+    def close(self):
+        self.limitar()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
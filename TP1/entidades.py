@@ -0,0 +1,110 @@
+"""Índice normalizado das entidades mencionadas (pessoas e lugares) em arquivo.db.
+
+Cada entidade é guardada uma só vez na tabela `entidades`, com o nome
+canónico (a primeira forma encontrada) e uma chave normalizada, sem acentos
+nem diferenças de maiúsculas/espaços, por isso "João Gonçalves" e
+"joao  goncalves" são a mesma pessoa. A tabela `mencoes` liga entidades e
+documentos (muitos-para-muitos), indexada nos dois sentidos:
+
+    with sqlite3.connect("arquivo.db") as conn:
+        e = Entidades(conn)
+        e.documentos("Casa de Pindela")
+        e.coocorrencias("António Vaz Vieira", tipo="lugar")
+"""
+import json
+import re
+import unicodedata
+
+ESPACOS = re.compile(r"\s+")
+
+
+def normalizar(nome):
+    """Chave de pesquisa: sem acentos, em minúsculas e com os espaços normalizados."""
+    decomposto = unicodedata.normalize("NFKD", nome)
+    sem_acentos = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return ESPACOS.sub(" ", sem_acentos.casefold()).strip()
+
+
+class Entidades:
+    def __init__(self, conn):
+        self.conn = conn
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entidades (
+                id INTEGER PRIMARY KEY,
+                nome TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                UNIQUE (chave, tipo)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS mencoes (
+                entidade_id INTEGER NOT NULL REFERENCES entidades(id),
+                doc_id TEXT NOT NULL,
+                PRIMARY KEY (entidade_id, doc_id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS mencoes_doc ON mencoes(doc_id, entidade_id)")
+        self._ids = None
+
+    def _resolver(self, novas):
+        """
+        Insere as entidades ainda não vistas, {(chave, tipo): nome}, de uma vez
+        e lê os ids atribuídos numa só consulta.
+        """
+        self.conn.executemany("INSERT OR IGNORE INTO entidades (nome, chave, tipo) VALUES (?, ?, ?)",
+                              ((nome, chave, tipo) for (chave, tipo), nome in novas.items()))
+        self._ids.update(((c, t), i) for i, c, t in self.conn.execute("""
+            SELECT e.id, e.chave, e.tipo
+            FROM json_each(?) j
+            JOIN entidades e ON e.chave = json_extract(j.value, '$[0]') AND e.tipo = json_extract(j.value, '$[1]')
+        """, (json.dumps(list(novas), ensure_ascii=False),)))
+
+    def guardar(self, mencoes):
+        """Regista pares (doc_id, [(nome, tipo), ...]) na transação em curso."""
+        if self._ids is None:
+            self._ids = {(c, t): i for i, c, t in self.conn.execute("SELECT id, chave, tipo FROM entidades")}
+        pares = [(doc_id, (normalizar(nome), tipo), nome) for doc_id, entidades in mencoes for nome, tipo in entidades]
+        novas = {}
+        for _, chave, nome in pares:
+            if chave not in self._ids:
+                # O nome canónico é a primeira forma encontrada
+                novas.setdefault(chave, nome)
+        if novas:
+            self._resolver(novas)
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO mencoes (entidade_id, doc_id) VALUES (?, ?)",
+            [(self._ids[chave], doc_id) for doc_id, chave, _ in pares])
+
+    def remover(self, doc_ids):
+        """Apaga as menções dos documentos indicados e as entidades que deixam de ser mencionadas."""
+        self.conn.executemany("DELETE FROM mencoes WHERE doc_id = ?", ((d,) for d in doc_ids))
+        self.conn.execute("""
+            DELETE FROM entidades
+            WHERE NOT EXISTS (SELECT 1 FROM mencoes WHERE entidade_id = entidades.id)
+        """)
+        self._ids = None
+
+    def documentos(self, nome, tipo=None):
+        """Documentos (doc_id) que mencionam `nome`, comparado pela chave normalizada."""
+        condicao_tipo = "AND e.tipo = ?" if tipo else ""
+        params = (normalizar(nome), tipo) if tipo else (normalizar(nome),)
+        return [doc_id for (doc_id,) in self.conn.execute(f"""
+            SELECT DISTINCT m.doc_id FROM entidades e JOIN mencoes m ON m.entidade_id = e.id
+            WHERE e.chave = ? {condicao_tipo}
+            ORDER BY m.doc_id
+        """, params)]
+
+    def coocorrencias(self, nome, de="pessoa", tipo="lugar", limite=10):
+        """As entidades de `tipo` mais mencionadas nos mesmos documentos que `nome` (do tipo `de`)."""
+        return self.conn.execute("""
+            SELECT e2.nome, COUNT(*) AS n
+            FROM entidades e1
+            JOIN mencoes m1 ON m1.entidade_id = e1.id
+            JOIN mencoes m2 ON m2.doc_id = m1.doc_id
+            JOIN entidades e2 ON e2.id = m2.entidade_id
+            WHERE e1.chave = ? AND e1.tipo = ? AND e2.tipo = ? AND e2.id != e1.id
+            GROUP BY e2.id
+            ORDER BY n DESC, e2.nome
+            LIMIT ?
+        """, (normalizar(nome), de, tipo, limite)).fetchall()
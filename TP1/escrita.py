@@ -0,0 +1,21 @@
+"""Escrita de texto produzido aos bocados, partilhada pelas scripts que geram ficheiros grandes.
+
+    escrever(renderizar(raizes(nodes), EmissorWiki()), "output/wiki.txt")
+    escrever(render_records(registos, 'html'), "registos.html")
+"""
+import os
+from typing import Iterable
+
+
+def escrever(pedacos: Iterable[str], path: str, buffer: int = 1 << 20):
+    """Grava os pedaços de texto em `path` (criando a diretoria), em blocos de ~`buffer` caracteres."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8", buffering=buffer) as f:
+        bloco, tamanho = [], 0
+        for pedaco in pedacos:
+            bloco.append(pedaco)
+            tamanho += len(pedaco)
+            if tamanho >= buffer:
+                f.write("".join(bloco))
+                bloco, tamanho = [], 0
+        f.write("".join(bloco))
@@ -0,0 +1,189 @@
+"""Servidor OAI-PMH falso, local, para testar e medir a recolha sem rede.
+
+Gera registos oai_dc sintéticos com a mesma forma dos do Arquivo Alberto
+Sampaio (título, datas, códigos PT/... hierárquicos, setSpec) e responde a
+ListSets e ListRecords com paginação por resumptionToken e filtros
+set/from/until.
+
+    with FakeOAIServer(n_registos=5000, sets=4) as servidor:
+        recolher(servidor.url, "records")
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+FUNDOS = ["CSC", "AS-AS", "CPD", "CMVNF", "FAM", "PAR", "NOT", "JUD"]
+
+HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+          '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/" '
+          'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+          '<responseDate>2025-01-01T00:00:00Z</responseDate>'
+          '<request verb="{verb}">{url}</request>')
+
+RECORD = ('<record><header><identifier>oai:arquivoalbertosampaio.org:{id}</identifier>'
+          '<datestamp>{datestamp}</datestamp><setSpec>{set}</setSpec></header>'
+          '<metadata><oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" '
+          'xmlns:dc="http://purl.org/dc/elements/1.1/">'
+          '<dc:title>{titulo}</dc:title>'
+          '<dc:publisher>Município de Vila Nova de Famalicão - Arquivo Municipal Alberto Sampaio</dc:publisher>'
+          '<dc:subject>{assunto}</dc:subject>'
+          '<dc:date>{inicio}</dc:date><dc:date>{fim}</dc:date>'
+          '<dc:type>{tipo}</dc:type>'
+          '<dc:format>1 documento; papel.</dc:format>'
+          '<dc:language>por</dc:language>'
+          '<dc:identifier>http://www.arquivoalbertosampaio.org/details?id={id}</dc:identifier>'
+          '<dc:identifier>{codigo}</dc:identifier>'
+          '<dc:relation>http://www.arquivoalbertosampaio.org/PublicRestServices/Description/{id}/thumbnail</dc:relation>'
+          '</oai_dc:dc></metadata></record>')
+
+ASSUNTOS = [
+    "Fotografias tiradas em Vila Nova de Famalicão por José Sousa Cristino.",
+    "Carta de António Vaz Vieira dirigida a João Pereira de Sousa, em Braga.",
+    "Escritura de compra e venda de terreno na freguesia de Calendário.",
+    "Registo de batismo celebrado na igreja de Santiago de Antas.",
+    "Correspondência entre Luís de Carvalho e Beatriz de Almeida sobre a Casa de Pindela.",
+]
+
+TIPOS = ["F", "SC", "SSC", "SR", "UI", "D"]
+
+
+def gerar_registos(n_registos, sets=4, ano_inicial=2015):
+    """Gera `n_registos` dicionários com a estrutura que o servidor serializa."""
+    registos = []
+    for i in range(n_registos):
+        fundo = FUNDOS[i % len(FUNDOS)]
+        serie = (i // len(FUNDOS)) % 50
+        ano = 1700 + (i * 7) % 300
+        codigo = f"PT/MVNF/AMAS/{fundo}/{serie:03d}/{i:06d}"
+        registos.append({
+            "id": 100000 + i,
+            "set": f"set_{i % sets}",
+            "datestamp": f"{ano_inicial + i % 10}-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            "titulo": f"Documento {i} do fundo {fundo}",
+            "assunto": ASSUNTOS[i % len(ASSUNTOS)],
+            "inicio": ano,
+            "fim": ano + i % 20,
+            "tipo": TIPOS[min(codigo.count("/"), len(TIPOS) - 1)],
+            "codigo": codigo,
+        })
+    return registos
+
+
+class FakeOAIServer:
+    """Servidor OAI-PMH numa thread; usar como gestor de contexto.
+
+    `latencia` atrasa cada resposta (em segundos) para simular a rede e
+    `falhar_apos` responde com HTTP 500 a partir da n-ésima página servida,
+    simulando uma recolha interrompida.
+    """
+
+    def __init__(self, n_registos=1000, sets=4, por_pagina=100, latencia=0.0, falhar_apos=None):
+        self.registos = gerar_registos(n_registos, sets)
+        self.sets = sorted({r["set"] for r in self.registos})
+        self.por_pagina = por_pagina
+        self.latencia = latencia
+        self.falhar_apos = falhar_apos
+        self.paginas_servidas = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/OAI-PMH/"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _filtrar(self, set_spec, desde, ate):
+        return [r for r in self.registos
+                if (not set_spec or r["set"] == set_spec)
+                and (not desde or r["datestamp"] >= desde)
+                and (not ate or r["datestamp"] <= ate)]
+
+    def responder(self, params):
+        """Devolve (status, corpo) para os parâmetros OAI de um pedido."""
+        verb = params.get("verb")
+        cabecalho = HEADER.format(verb=escape(verb or ""), url=escape(self.url))
+
+        if verb == "ListSets":
+            sets = "".join(f"<set><setSpec>{s}</setSpec><setName>{s}</setName></set>" for s in self.sets)
+            return 200, f"{cabecalho}<ListSets>{sets}</ListSets></OAI-PMH>"
+
+        if verb != "ListRecords":
+            return 200, f'{cabecalho}<error code="badVerb">Verbo inválido</error></OAI-PMH>'
+
+        token = params.get("resumptionToken")
+        if token:
+            try:
+                set_spec, desde, ate, offset = token.split("|")
+                offset = int(offset)
+            except ValueError:
+                return 200, f'{cabecalho}<error code="badResumptionToken">{escape(token)}</error></OAI-PMH>'
+        else:
+            set_spec, desde, ate, offset = params.get("set", ""), params.get("from", ""), params.get("until", ""), 0
+
+        with self._lock:
+            self.paginas_servidas += 1
+            if self.falhar_apos is not None and self.paginas_servidas > self.falhar_apos:
+                return 500, "falha simulada"
+
+        selecionados = self._filtrar(set_spec, desde, ate)
+        if not selecionados:
+            return 200, f'{cabecalho}<error code="noRecordsMatch">Sem registos</error></OAI-PMH>'
+
+        pagina = selecionados[offset:offset + self.por_pagina]
+        corpo = [cabecalho, "<ListRecords>"]
+        for r in pagina:
+            corpo.append(RECORD.format(**{k: escape(str(v)) for k, v in r.items()}))
+        seguinte = offset + self.por_pagina
+        if seguinte < len(selecionados):
+            corpo.append(f'<resumptionToken completeListSize="{len(selecionados)}" cursor="{offset}">'
+                         f'{set_spec}|{desde}|{ate}|{seguinte}</resumptionToken>')
+        else:
+            corpo.append(f'<resumptionToken completeListSize="{len(selecionados)}" cursor="{offset}"/>')
+        corpo.append("</ListRecords></OAI-PMH>")
+        return 200, "".join(corpo)
+
+    def _handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                if servidor.latencia:
+                    time.sleep(servidor.latencia)
+                status, corpo = servidor.responder(params)
+                dados = corpo.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/xml; charset=utf-8")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 30920
+    with FakeOAIServer(n_registos=n) as servidor:
+        print(f"Servidor OAI-PMH falso com {n} registos em {servidor.url} (Ctrl+C para terminar)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
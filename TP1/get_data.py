@@ -1,38 +1,83 @@
-from asyncio import sleep
+"""
+Recolha dos registos em bruto (dados_brutos.yaml) e funções para os analisar e apresentar.
+
+Importar este módulo não tem efeitos secundários; cada passo corre uma vez
+a partir da linha de comandos:
+
+    python3 get_data.py recolher [--endpoint URL]   # OAI-PMH -> dados_brutos.yaml
+    python3 get_data.py analisar                    # campos, constantes e chaves
+    python3 get_data.py wiki                        # registos com data, em formato wiki
+    python3 get_data.py html [--saida registos.html]
+    python3 get_data.py tudo                        # todos os passos, por esta ordem
+"""
+import argparse
+import os
+import time
+from collections import defaultdict
+from functools import lru_cache
+
 import yaml
-import re
-from sickle import Sickle
 from langcodes import Language
 
+from escrita import escrever
+
 # OAI-PMH endpoint: Famalicão (Alberto Sampaio)
-endpoint = "https://www.arquivoalbertosampaio.org/OAI-PMH/"
-sickle = Sickle(endpoint)
+ENDPOINT = "https://www.arquivoalbertosampaio.org/OAI-PMH/"
 
-dados = {"Registos": []}
+DIRETORIA = os.path.dirname(os.path.abspath(__file__))
+DADOS = os.path.join(DIRETORIA, "dados_brutos.yaml")
+HTML = os.path.join(DIRETORIA, "registos.html")
+# Registos por ficheiro HTML (registos.html, registos-2.html, ...)
+REGISTOS_POR_PAGINA = 500
 
-def save_to_file():
-    with open("./TP1/dados_brutos.yaml", "w", encoding="utf-8") as f:
-        yaml.dump(dados, f, allow_unicode=True, default_flow_style=False)
-    print("Dados parciais salvos no ficheiro 'dados_brutos.yaml'.")
 
+# Escrita/leitura do YAML com a libyaml, se estiver disponível
+DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
 
-print("\nComeçando a registar...")
-registos = sickle.ListRecords(metadataPrefix='oai_dc')
 
-for i, registo in enumerate(registos, start=1):
-    dados["Registos"].append(dict(registo)) 
-    f=i
-    if f == 500:  # Salvando a cada 500 registos e (adormece durante 5 segundos e retoma)
-        save_to_file()
-        print(f"{i} registos...")
-        f=0
-        sleep(5)
+def save_to_file(dados, path=DADOS):
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.dump(dados, f, Dumper=DUMPER, allow_unicode=True, default_flow_style=False)
+    print(f"Dados parciais salvos no ficheiro '{os.path.basename(path)}'.")
 
-# Caso tivesse um ficheiro em falta para salvar
-save_to_file()
-print("Concluído. Todos os dados encontram-se no ficheiro 'dados_brutos.yaml'.")
 
-from langcodes import Language
+def harvest(endpoint=ENDPOINT, path=DADOS, lote=500, pausa=5):
+    """Recolhe todos os registos oai_dc, guardando (e fazendo uma pausa) a cada `lote` registos."""
+    from sickle import Sickle
+
+    sickle = Sickle(endpoint)
+    dados = {"Registos": []}
+
+    print("\nComeçando a registar...")
+    registos = sickle.ListRecords(metadataPrefix='oai_dc')
+
+    for i, registo in enumerate(registos, start=1):
+        dados["Registos"].append(dict(registo))
+        if i % lote == 0:  # Salvando a cada 500 registos (adormece durante 5 segundos e retoma)
+            save_to_file(dados, path)
+            print(f"{i} registos...")
+            time.sleep(pausa)
+
+    # Caso tivesse um ficheiro em falta para salvar
+    save_to_file(dados, path)
+    print(f"Concluído. Todos os dados encontram-se no ficheiro '{os.path.basename(path)}'.")
+    return dados
+
+
+def load_data(path=DADOS):
+    with open(path, encoding="utf-8") as f:
+        return yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+@lru_cache(maxsize=None)
+def _nome_idioma(lang_code):
+    # O arquivo tem poucos códigos distintos: cada um só é resolvido uma vez
+    try:
+        lang = Language.get(lang_code)
+        return lang.display_name() if lang.is_valid() else lang_code
+    except:
+        return lang_code
+
 
 def get_language_name(lang_code):
     """
@@ -49,104 +94,193 @@ def get_language_name(lang_code):
     if not lang_code:
         return ''
     
-    try:
-        lang = Language.get(str(lang_code))  # Converte para string para segurança
-        return lang.display_name() if lang.is_valid() else lang_code
-    except:
-        return lang_code
+    resultado = _nome_idioma(str(lang_code))  # Converte para string para segurança
+    return lang_code if resultado == str(lang_code) else resultado
 
 
-def pretty_print(registo, output_format='text', config=None, registo_num=None):
-    # função para dar print (pretty) em html, wiki e yaml
-    if config is None:
-        config = {
-            'title': {'prefix': 'Title: ', 'format': '{value}'},
-            'date': {'prefix': 'Date: ', 'format': '{value[0]} - {value[1]}'},
-            'format': {'prefix': 'Format: ', 'format': '{value}'},
-            'identifier': {'prefix': 'ID: ', 'format': '{value[0]}'},
-            'language': {'prefix': 'Language: ', 'format': '{value}'},
-            'publisher': {'prefix': 'Publisher: ', 'format': '{value[0]}'},
-            'relation': {'prefix': 'Relation: ', 'format': '{value[0]}'},
-            'subject': {'prefix': 'Subject: ', 'format': '{value[0]}'},
-            'type': {'prefix': 'Type: ', 'format': '{value[0]}'},
-            'default': {'prefix': '', 'format': '{value}'}
-        }
-
-    def format_field(field, value):
-        if not value:
-            return ""
-        
-        field_config = config.get(field, config['default'])
-        
+CONFIG_PADRAO = {
+    'title': {'prefix': 'Title: ', 'format': '{value}'},
+    'date': {'prefix': 'Date: ', 'format': '{value[0]} - {value[1]}'},
+    'format': {'prefix': 'Format: ', 'format': '{value}'},
+    'identifier': {'prefix': 'ID: ', 'format': '{value[0]}'},
+    'language': {'prefix': 'Language: ', 'format': '{value}'},
+    'publisher': {'prefix': 'Publisher: ', 'format': '{value[0]}'},
+    'relation': {'prefix': 'Relation: ', 'format': '{value[0]}'},
+    'subject': {'prefix': 'Subject: ', 'format': '{value[0]}'},
+    'type': {'prefix': 'Type: ', 'format': '{value[0]}'},
+    'default': {'prefix': '', 'format': '{value}'}
+}
+
+CABECALHO_HTML = '''<!DOCTYPE html>
+<html>
+<head>
+    <title>Arquivos de Famalicão (Alberto Sampaio)</title>
+    <style>
+        body { font-family: Arial, sans-serif; line-height: 1.6; margin: 20px; }
+        .registo { border: 1px solid #ddd; padding: 15px; margin-bottom: 20px; }
+        h1 { color: #333; }
+        .summary { margin: 30px 0; }
+        table { border-collapse: collapse; width: 50%; }
+        th, td { padding: 8px; text-align: left; border-bottom: 1px solid #ddd; }
+    </style>
+</head>
+<body>
+    <h1>Arquivos de Famalicão (Alberto Sampaio)</h1>
+'''
+
+
+class Formatador:
+    """
+    A `config` de pretty_print compilada uma só vez: para cada campo, o
+    prefixo (wiki), a etiqueta (<dt> em HTML) e uma função valor -> texto.
+
+        fmt = Formatador()
+        fmt.html(registo); fmt.wiki(registo)
+    """
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else CONFIG_PADRAO
+        self._campos = {}
+
+    def _compilar(self, field):
+        field_config = self.config.get(field, self.config['default'])
+        formato = field_config['format']
+        # '{value}' é só str(); os outros formatos ficam com o str.format já ligado
+        aplicar = str if formato == '{value}' else formato.format
+
         if field == 'language':
-            value = get_language_name(value)
-        
-        # Se for uma lista, junta os elementos corretamente, garantindo que não é uma string acidentalmente tratada como lista
-        if field =='title' or field == 'format':
-            value = ", ".join(value)
-        
-        try:
-            return field_config['format'].format(value=value)
-        except (IndexError, KeyError):
-            return str(value)  # Fallback para dados malformados
+            converter = get_language_name
+        elif field == 'title' or field == 'format':
+            # Se for uma lista, junta os elementos corretamente
+            converter = ", ".join
+        else:
+            converter = None
 
+        def format_field(value):
+            if converter is not None:
+                value = converter(value)
+            try:
+                return aplicar(value) if aplicar is str else aplicar(value=value)
+            except (IndexError, KeyError):
+                return str(value)  # Fallback para dados malformados
 
-    if output_format == 'html':
-        output = ['<div class="registo">']
-        output.append('<dl class="registo-metadata">')
+        prefix = field_config['prefix']
+        campo = self._campos[field] = (prefix, prefix.strip(": "), format_field)
+        return campo
+
+    def campo(self, field):
+        """(prefixo, etiqueta, format_field) do campo, compilado na primeira utilização."""
+        campo = self._campos.get(field)
+        return campo if campo is not None else self._compilar(field)
+
+    def html(self, registo):
+        output = ['<div class="registo">', '<dl class="registo-metadata">']
         for field, value in registo.items():
             if value:
-                formatted_value = format_field(field, value)
-                output.append(f'<dt>{config.get(field, config["default"])["prefix"].strip(": ")}</dt>')
-                output.append(f'<dd>{formatted_value}</dd>')
+                _, etiqueta, format_field = self.campo(field)
+                output.append(f'<dt>{etiqueta}</dt>')
+                output.append(f'<dd>{format_field(value)}</dd>')
         output.append('</dl></div>')
         return '\n'.join(output)
-    
-    elif output_format == 'wiki':
+
+    def wiki(self, registo):
         output = []
         for field, value in registo.items():
             if value:
-                formatted_value = format_field(field, value)
-                prefix = config.get(field, config['default'])['prefix']
-                output.append(f"* {prefix}{formatted_value}")
+                prefix, _, format_field = self.campo(field)
+                output.append(f"* {prefix}{format_field(value)}")
         return '\n'.join(output)
+
+
+_FORMATADOR = Formatador()
+
+
+def pretty_print(registo, output_format='text', config=None, registo_num=None):
+    # função para dar print (pretty) em html, wiki e yaml
+    formatador = _FORMATADOR if config is None else Formatador(config)
+
+    if output_format == 'html':
+        return formatador.html(registo)
+    
+    elif output_format == 'wiki':
+        return formatador.wiki(registo)
     
     elif output_format == 'yaml':
-        with open('./TP1/dados_brutos.yaml', 'r', encoding='utf-8') as f:
+        with open(DADOS, 'r', encoding='utf-8') as f:
             content = f.read()
         print(content) 
     
     else:
         raise ValueError(f"Unsupported format: {output_format}")
-    
 
-# Salvar os dados num ficheiro HTML
-def save_records_html(registos, filename="registos_output.html"):
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write('''<!DOCTYPE html>
-<html>
-<head>
-    <title>Arquivos de Famalicão (Alberto Sampaio)</title>
-    <style>
-        body { font-family: Arial, sans-serif; line-height: 1.6; margin: 20px; }
-        .registo { border: 1px solid #ddd; padding: 15px; margin-bottom: 20px; }
-        h1 { color: #333; }
-        .summary { margin: 30px 0; }
-        table { border-collapse: collapse; width: 50%; }
-        th, td { padding: 8px; text-align: left; border-bottom: 1px solid #ddd; }
-    </style>
-</head>
-<body>
-    <h1>Arquivos de Famalicão (Alberto Sampaio)</h1>
-''')
-        
+
+def render_records(registos, output_format='html', formatador=None, lote=1000, inicio=1, navegacao=''):
+    """
+    Texto de um ficheiro com todos os `registos` (html, wiki ou yaml), aos bocados.
+    Em HTML, os registos são numerados a partir de `inicio` e `navegacao` vai no fim da página.
+    """
+    formatador = formatador or _FORMATADOR
+    if output_format == 'html':
+        yield CABECALHO_HTML
+        for i, registo in enumerate(registos, inicio):
+            yield f'<h3>Registo {i}</h3>'
+            yield formatador.html(registo)
+        yield f'{navegacao}</body>\n</html>'
+
+    elif output_format == 'wiki':
         for i, registo in enumerate(registos, 1):
-            f.write(f'<h3>Registo {i}</h3>')
-            f.write(pretty_print(registo, 'html'))
-        
-        f.write('</body>\n</html>')
+            yield f"== Registo {i} ==\n{formatador.wiki(registo)}\n\n"
+
+    elif output_format == 'yaml':
+        # O mesmo documento que save_to_file, com a lista despejada em lotes
+        yield "Registos:\n"
+        bloco = []
+        for registo in registos:
+            bloco.append(registo)
+            if len(bloco) == lote:
+                yield yaml.dump(bloco, Dumper=DUMPER, allow_unicode=True, default_flow_style=False)
+                bloco = []
+        if bloco:
+            yield yaml.dump(bloco, Dumper=DUMPER, allow_unicode=True, default_flow_style=False)
+
+    else:
+        raise ValueError(f"Unsupported format: {output_format}")
+
+
+def save_records(registos, filename, output_format='html', formatador=None):
+    escrever(render_records(registos, output_format, formatador), filename)
     print(f"Todos os registos armazenados em {filename}.\n")
 
+
+def pagina_html(filename, pagina):
+    """Ficheiro da página `pagina` de `filename`: o próprio na primeira, depois <nome>-2.html, <nome>-3.html, ..."""
+    if pagina == 1:
+        return filename
+    nome, extensao = os.path.splitext(filename)
+    return f"{nome}-{pagina}{extensao}"
+
+
+def _navegacao_html(filename, pagina, paginas):
+    ligacoes = []
+    if pagina > 1:
+        ligacoes.append(f'<a href="{os.path.basename(pagina_html(filename, pagina - 1))}">&laquo; anterior</a>')
+    ligacoes.append(f'página {pagina} de {paginas}')
+    if pagina < paginas:
+        ligacoes.append(f'<a href="{os.path.basename(pagina_html(filename, pagina + 1))}">seguinte &raquo;</a>')
+    return f'<p class="paginas">{" | ".join(ligacoes)}</p>\n'
+
+
+# Salvar os dados em HTML (uma só vez, no fim), `por_pagina` registos por ficheiro
+def save_records_html(registos, filename="registos_output.html", por_pagina=REGISTOS_POR_PAGINA, formatador=None):
+    paginas = max(1, -(-len(registos) // por_pagina))
+    for p in range(1, paginas + 1):
+        inicio = (p - 1) * por_pagina
+        navegacao = _navegacao_html(filename, p, paginas) if paginas > 1 else ''
+        escrever(render_records(registos[inicio:inicio + por_pagina], 'html', formatador, inicio=inicio + 1,
+                                navegacao=navegacao), pagina_html(filename, p))
+    print(f"Todos os registos armazenados em {filename} ({paginas} página(s)).\n")
+    return paginas
+
 def analyze_data_structure(data):
     field_counts = {}
     constant_fields = {}
@@ -171,8 +305,6 @@ def analyze_data_structure(data):
     print("Constant fields:", {k:v for k,v in constant_fields.items() if v is not None})
     print("Potential keys:", keys)
 
-analyze_data_structure(dados)
-
 def simplify_date(date_values):
     if not date_values:
         return {'start': None, 'end': None, 'certainty': 'unknown'}
@@ -189,7 +321,6 @@ def simplify_date(date_values):
         return {'start': date_values[0], 'end': date_values[-1], 'certainty': 'range'}
     
 def aggregate_by_type(data):
-    from collections import defaultdict
     by_type = defaultdict(list)
     
     for registo in data["Registos"]:
@@ -199,11 +330,42 @@ def aggregate_by_type(data):
     
     return by_type
 
-for registo in dados["Registos"]:
-    if 'date' in registo:
-        print("\n--- WIKI ---\n")
-        print(pretty_print(registo, 'wiki'))
-        registo['date_normalized'] = simplify_date(registo['date'])
-        save_records_html(dados["Registos"], "./TP1/registos.html")
+
+def normalize_dates(data):
+    """Acrescenta 'date_normalized' (simplify_date) aos registos com data."""
+    for registo in data["Registos"]:
+        if 'date' in registo:
+            registo['date_normalized'] = simplify_date(registo['date'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registos em bruto do Arquivo Municipal Alberto Sampaio.")
+    parser.add_argument("passo", choices=["recolher", "analisar", "wiki", "html", "tudo"])
+    parser.add_argument("--endpoint", default=ENDPOINT)
+    parser.add_argument("--dados", default=DADOS, help="ficheiro YAML com os registos em bruto")
+    parser.add_argument("--saida", default=HTML, help="ficheiro HTML (passo html)")
+    args = parser.parse_args()
+
+    passos = ["recolher", "analisar", "wiki", "html"] if args.passo == "tudo" else [args.passo]
+    dados = harvest(args.endpoint, args.dados) if "recolher" in passos else load_data(args.dados)
+
+    if "analisar" in passos:
+        analyze_data_structure(dados)
+
+    if "wiki" in passos:
+        for registo in dados["Registos"]:
+            if 'date' in registo:
+                print("\n--- WIKI ---\n")
+                print(pretty_print(registo, 'wiki'))
+
+    if "html" in passos:
+        normalize_dates(dados)
+        inicio = time.perf_counter()
+        save_records_html(dados["Registos"], args.saida)
+        duracao = time.perf_counter() - inicio
+        n = len(dados["Registos"])
+        print(f"{n} registos em HTML em {duracao:.2f}s ({n / max(duracao, 1e-9):.0f} registos/s).")
 
 
+if __name__ == "__main__":
+    main()
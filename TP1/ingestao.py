@@ -0,0 +1,107 @@
+"""Ingestão incremental: manifesto dos registos e estado de cada etapa.
+
+O manifesto (`records/.manifesto.db`) guarda, para cada `record_*.xml`, o
+hash do conteúdo e o datestamp OAI. Só os ficheiros cujo tamanho ou mtime
+mudaram desde a última vez são relidos, por isso atualizá-lo depois de uma
+recolha incremental é rápido. Um ficheiro regravado com o mesmo tamanho e
+o mesmo datestamp (a recolha volta a pedir os registos do último dia) não
+mudou para o OAI-PMH: basta ler o cabeçalho, e o hash antigo mantém-se.
+
+Cada etapa (2_estrutura, 6_procura, 7_entidades) guarda na sua própria base
+de dados a tabela `ingestao` com o hash com que processou cada ficheiro;
+comparando-a com o manifesto obtém-se o que é novo ou alterado (para
+processar) e o que foi removido (para apagar). Como o estado vive junto dos
+dados, apagar a base de dados de uma etapa reprocessa tudo nessa etapa.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+
+MANIFESTO = ".manifesto.db"
+
+DATESTAMP = re.compile(rb"<(?:\w+:)?datestamp>([^<]*)<")
+# O datestamp vem no <header>, no início do registo
+CABECALHO = 4096
+
+
+def ler_datestamp(conteudo):
+    datestamp = DATESTAMP.search(conteudo)
+    return datestamp.group(1).decode().strip() if datestamp else None
+
+
+def atualizar_manifesto(records_dir="records"):
+    """Atualiza e devolve o manifesto {ficheiro: hash} de `records_dir`."""
+    conn = sqlite3.connect(os.path.join(records_dir, MANIFESTO))
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS manifesto (
+            ficheiro TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            datestamp TEXT,
+            tamanho INTEGER,
+            mtime INTEGER
+        )
+    """)
+    conhecidos = {f: (t, m, d, h) for f, t, m, d, h in
+                  conn.execute("SELECT ficheiro, tamanho, mtime, datestamp, hash FROM manifesto")}
+
+    atuais = set()
+    alterados = []
+    with os.scandir(records_dir) as entradas:
+        for entrada in entradas:
+            if not (entrada.name.startswith("record_") and entrada.name.endswith(".xml")):
+                continue
+            atuais.add(entrada.name)
+            st = entrada.stat()
+            tamanho, mtime, datestamp, hash_ = conhecidos.get(entrada.name, (None, None, None, None))
+            if (tamanho, mtime) == (st.st_size, st.st_mtime_ns):
+                continue
+            with open(entrada.path, "rb") as f:
+                conteudo = f.read(CABECALHO)
+                if tamanho == st.st_size and datestamp is not None and ler_datestamp(conteudo) == datestamp:
+                    # Regravado sem alterações: o hash não precisa de ser recalculado
+                    alterados.append((entrada.name, hash_, datestamp, st.st_size, st.st_mtime_ns))
+                    continue
+                conteudo += f.read()
+            alterados.append((entrada.name, hashlib.sha1(conteudo).hexdigest(), ler_datestamp(conteudo),
+                              st.st_size, st.st_mtime_ns))
+
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO manifesto VALUES (?, ?, ?, ?, ?)", alterados)
+        conn.executemany("DELETE FROM manifesto WHERE ficheiro = ?", ((f,) for f in conhecidos.keys() - atuais))
+    manifesto = dict(conn.execute("SELECT ficheiro, hash FROM manifesto"))
+    conn.close()
+    return manifesto
+
+
+class Ingestao:
+    """Estado de uma etapa: com que hash foi processado cada ficheiro."""
+
+    def __init__(self, conn, etapa):
+        self.conn = conn
+        self.etapa = etapa
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingestao (
+                etapa TEXT,
+                ficheiro TEXT,
+                hash TEXT,
+                PRIMARY KEY (etapa, ficheiro)
+            )
+        """)
+
+    def delta(self, manifesto):
+        """Devolve (pendentes, removidos): ficheiros novos/alterados e ficheiros que já não existem."""
+        processados = dict(self.conn.execute(
+            "SELECT ficheiro, hash FROM ingestao WHERE etapa = ?", (self.etapa,)))
+        pendentes = sorted(f for f, h in manifesto.items() if processados.get(f) != h)
+        removidos = sorted(processados.keys() - manifesto.keys())
+        return pendentes, removidos
+
+    def marcar(self, pares):
+        """Regista pares (ficheiro, hash) como processados (na transação em curso)."""
+        self.conn.executemany("INSERT OR REPLACE INTO ingestao VALUES (?, ?, ?)",
+                              ((self.etapa, f, h) for f, h in pares))
+
+    def esquecer(self, ficheiros):
+        self.conn.executemany("DELETE FROM ingestao WHERE etapa = ? AND ficheiro = ?",
+                              ((self.etapa, f) for f in ficheiros))
@@ -0,0 +1,174 @@
+"""Pesquisa ordenada e paginada sobre o índice FTS5 de 6_procura.py.
+
+    from pesquisa import Pesquisa
+
+    with Pesquisa() as p:
+        pagina = p.procurar("fotografia", limite=10)
+        seguinte = p.procurar("fotografia", limite=10, depois=pagina[-1])
+
+Os resultados vêm ordenados por bm25() com pesos por coluna (o título conta
+mais do que o assunto) e trazem o título com os termos realçados e um
+excerto do assunto. Podem ser filtrados por intervalo de datas (sobreposição
+com [data_inicio, data_fim], via R*Tree) e por tipo (índice B-tree):
+
+        p.procurar("fotografia", inicio=1876, fim=1914, tipo="UI")
+
+O texto dos registos é escapado para HTML (`escapar=False` devolve-o tal
+como está, por exemplo para o terminal); o realce é feito com marcas
+sentinela que só depois do escape são trocadas pelas `marcas` pedidas, por
+isso um `<` ou `&` num título nunca se confunde com markup.
+
+A ligação à base de dados fica aberta entre pesquisas e o texto de cada
+consulta é sempre o mesmo, por isso o sqlite3 reaproveita os statements já
+preparados.
+"""
+import html
+import sqlite3
+import time
+
+DB_NAME = "arquivo.db"
+
+ANO_MIN, ANO_MAX = -2**31, 2**31 - 1
+
+# Colunas de documentos_fts, pela ordem em que foram criadas
+COLUNAS = ("titulo", "assunto", "tipo", "formato")
+PESOS = {"titulo": 10.0, "assunto": 5.0, "tipo": 1.0, "formato": 1.0}
+
+# Marcas de realce dentro do SQLite (caracteres de uso privado, que não aparecem nos registos)
+SENTINELAS = ("\ue000", "\ue001")
+
+
+class Pesquisa:
+    def __init__(self, db=DB_NAME, pesos=None, marcas=("<b>", "</b>"), palavras_excerto=16, escapar=True):
+        self.conn = sqlite3.connect(db)
+        self.conn.row_factory = sqlite3.Row
+        self.marcas = marcas
+        self.escapar = escapar
+        pesos = {**PESOS, **(pesos or {})}
+        bm25 = "bm25(documentos_fts, " + ", ".join(str(float(pesos[c])) for c in COLUNAS) + ")"
+        abre, fecha = SENTINELAS
+        self._select = f"""
+            SELECT f.rowid, f.score, f.titulo, f.excerto, d.codigo, d.url
+            FROM (
+                SELECT rowid, {bm25} AS score,
+                       highlight(documentos_fts, 0, '{abre}', '{fecha}') AS titulo,
+                       snippet(documentos_fts, 1, '{abre}', '{fecha}', '…', {int(palavras_excerto)}) AS excerto
+                FROM documentos_fts
+                WHERE documentos_fts MATCH :termo {{filtros}} {{keyset}}
+                ORDER BY score, rowid
+                LIMIT :limite OFFSET :offset
+            ) f
+            JOIN documentos d ON d.rowid = f.rowid
+            ORDER BY f.score, f.rowid
+        """
+        self._keyset = f"AND ({bm25} > :score OR ({bm25} = :score AND rowid > :rowid))"
+        self.latencias = []
+
+    def _texto(self, texto):
+        """Escapa o texto e troca as sentinelas de realce pelas marcas."""
+        if texto is None:
+            return None
+        if self.escapar:
+            texto = html.escape(texto)
+        return texto.replace(SENTINELAS[0], self.marcas[0]).replace(SENTINELAS[1], self.marcas[1])
+
+    def _filtros(self, params, inicio, fim, tipo):
+        """
+        Condições sobre o rowid para os filtros estruturados.
+
+        Cada filtro é resolvido primeiro no seu índice (R*Tree para as datas,
+        B-tree para o tipo) e só o conjunto de rowids resultante é cruzado com
+        os resultados da FTS, sem juntar cada resultado à tabela documentos.
+        """
+        # O "+" impede o SQLite de usar a lista de rowids para guiar a FTS
+        # (uma pesquisa MATCH por rowid), o que é muito mais lento
+        datas = inicio is not None or fim is not None
+        if datas:
+            params.update(inicio=ANO_MIN if inicio is None else inicio, fim=ANO_MAX if fim is None else fim)
+        if tipo is not None:
+            params["tipo"] = tipo
+            # Índice (tipo, data_inicio, data_fim): tipo e datas resolvidos no mesmo índice
+            intervalo = " AND data_inicio <= :fim AND data_fim >= :inicio" if datas else ""
+            return f" AND +rowid IN (SELECT rowid FROM documentos WHERE tipo = :tipo{intervalo})"
+        if datas:
+            return " AND +rowid IN (SELECT id FROM documentos_datas WHERE inicio <= :fim AND fim >= :inicio)"
+        return ""
+
+    def procurar(self, termo, limite=20, offset=0, depois=None, inicio=None, fim=None, tipo=None):
+        """
+        Uma página de resultados para `termo` (sintaxe MATCH do FTS5).
+
+        A paginação pode ser por `offset` ou, mais eficiente em páginas
+        avançadas, por keyset: `depois` é o último resultado da página anterior.
+        `inicio`/`fim` (anos) mantêm os documentos cujo intervalo de datas se
+        sobrepõe a [inicio, fim]; `tipo` filtra pelo tipo (F, SC, UI, D, ...).
+        Cada resultado é um dicionário com rowid, score, titulo (realçado),
+        excerto, codigo e url.
+        """
+        params = {"termo": termo, "limite": limite, "offset": offset}
+        filtros = self._filtros(params, inicio, fim, tipo)
+        keyset = ""
+        if depois is not None:
+            keyset = self._keyset
+            params.update(score=depois["score"], rowid=depois["rowid"], offset=0)
+
+        t0 = time.perf_counter()
+        sql = self._select.format(filtros=filtros, keyset=keyset)
+        resultados = [dict(row) for row in self.conn.execute(sql, params)]
+        for r in resultados:
+            r["titulo"], r["excerto"] = self._texto(r["titulo"]), self._texto(r["excerto"])
+        self.latencias.append(time.perf_counter() - t0)
+        return resultados
+
+    def contar(self, termo, inicio=None, fim=None, tipo=None):
+        params = {"termo": termo}
+        filtros = self._filtros(params, inicio, fim, tipo)
+        return self.conn.execute(
+            f"SELECT COUNT(*) FROM documentos_fts WHERE documentos_fts MATCH :termo {filtros}", params).fetchone()[0]
+
+    def filtrar(self, inicio=None, fim=None, tipo=None, limite=20, offset=0):
+        """Documentos (sem termo) cujo intervalo de datas se sobrepõe a [inicio, fim], por ordem de data."""
+        params = {"limite": limite, "offset": offset, "inicio": ANO_MIN if inicio is None else inicio,
+                  "fim": ANO_MAX if fim is None else fim}
+        condicao_tipo = ""
+        if tipo is not None:
+            params["tipo"] = tipo
+            condicao_tipo = "AND d.tipo = :tipo"
+        t0 = time.perf_counter()
+        resultados = [dict(row) for row in self.conn.execute(f"""
+            SELECT p.*, (SELECT titulo FROM documentos_fts WHERE rowid = p.rowid) AS titulo
+            FROM (
+                SELECT d.rowid, d.codigo, d.url, d.tipo, d.data_inicio, d.data_fim
+                FROM documentos_datas r JOIN documentos d ON d.rowid = r.id
+                WHERE r.inicio <= :fim AND r.fim >= :inicio {condicao_tipo}
+                ORDER BY d.data_inicio, d.rowid
+                LIMIT :limite OFFSET :offset
+            ) p
+        """, params)]
+        for r in resultados:
+            r["titulo"] = self._texto(r["titulo"])
+        self.latencias.append(time.perf_counter() - t0)
+        return resultados
+
+    def percentis(self, *ps):
+        """Latência (em ms) nos percentis pedidos, sobre as pesquisas feitas até agora."""
+        ordenadas = sorted(self.latencias)
+        if not ordenadas:
+            return [None for _ in ps]
+        return [ordenadas[min(len(ordenadas) - 1, int(p / 100 * len(ordenadas)))] * 1000 for p in ps]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def procurar(termo, limite=20, offset=0, db=DB_NAME):
+    """Atalho para uma pesquisa isolada."""
+    with Pesquisa(db) as p:
+        return p.procurar(termo, limite, offset)
+
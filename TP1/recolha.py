@@ -0,0 +1,199 @@
+"""Recolha OAI-PMH concorrente e retomável.
+
+A recolha é dividida em partições (por setSpec e/ou por janelas de datas
+from/until) que são descarregadas em paralelo por um conjunto limitado de
+threads, partilhando um limite de pedidos por segundo (token bucket).
+
+Depois de cada página gravada em disco, o resumptionToken seguinte fica
+registado num ficheiro de checkpoint; se o processo morrer, a recolha
+recomeça a partir da última página boa de cada partição. Os ficheiros de
+registo têm o nome derivado do identificador OAI, por isso repetir uma
+página não cria duplicados.
+
+Uma partição concluída guarda também o datestamp mais recente que viu;
+voltar a correr a recolha pede essa partição de novo com `from=` a partir
+desse datestamp, e só os registos novos ou alterados são descarregados.
+"""
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from sickle import Sickle, oaiexceptions
+from sickle.models import Record
+
+URL = "https://www.arquivoalbertosampaio.org/OAI-PMH/"
+OAI_NS = "{http://www.openarchives.org/OAI/2.0/}"
+CHECKPOINT = ".checkpoint.json"
+
+
+class TokenBucket:
+    """Limita os pedidos por segundo, de forma partilhada entre threads."""
+
+    def __init__(self, taxa, capacidade=None):
+        self.taxa = taxa
+        self.capacidade = capacidade or max(1.0, taxa)
+        self.tokens = self.capacidade
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consumir(self):
+        while True:
+            with self.lock:
+                agora = time.monotonic()
+                self.tokens = min(self.capacidade, self.tokens + (agora - self.ultimo) * self.taxa)
+                self.ultimo = agora
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                espera = (1 - self.tokens) / self.taxa
+            time.sleep(espera)
+
+
+class Checkpoint:
+    """Estado de cada partição (token, nº de registos, datestamps, concluída) num ficheiro JSON."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.estado = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.estado = json.load(f)
+
+    def get(self, chave):
+        with self.lock:
+            return dict(self.estado.get(chave, {}))
+
+    def atualizar(self, chave, **valores):
+        with self.lock:
+            self.estado.setdefault(chave, {}).update(valores)
+            # Escrita atómica: um crash a meio nunca deixa o checkpoint corrompido
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.estado, f, indent=1)
+            os.replace(tmp, self.path)
+
+
+def nome_ficheiro(identifier):
+    # oai:arquivoalbertosampaio.org:100146 -> record_100146.xml
+    return "record_" + re.sub(r"[^\w.-]", "_", identifier.rsplit(":", 1)[-1]) + ".xml"
+
+
+def chave_particao(set_spec, desde, ate):
+    return f"{set_spec or '*'}|{desde or ''}|{ate or ''}"
+
+
+def listar_sets(sickle):
+    return [s.setSpec for s in sickle.ListSets()]
+
+
+def janelas_datas(ano_inicio, ano_fim, passo=1):
+    """Janelas [from, until] de `passo` anos, para dividir a recolha por datestamp."""
+    for ano in range(ano_inicio, ano_fim + 1, passo):
+        yield f"{ano}-01-01", f"{min(ano + passo - 1, ano_fim)}-12-31"
+
+
+def levantar_erro_oai(erro):
+    code = erro.get("code", "")
+    raise getattr(oaiexceptions, code[:1].upper() + code[1:], oaiexceptions.OAIError)(erro.text)
+
+
+def recolher_particao(sickle, directory, checkpoint, bucket, set_spec=None, desde=None, ate=None):
+    """Descarrega uma partição página a página; devolve (registos, páginas pedidas).
+
+    Se a partição já foi concluída numa execução anterior, é pedida de novo
+    a partir do último datestamp visto, para apanhar registos novos ou
+    alterados; `from` é inclusivo, mas regravar um registo é inofensivo.
+    """
+    chave = chave_particao(set_spec, desde, ate)
+    estado = checkpoint.get(chave)
+    ultimo = estado.get("ultimo")
+    if estado.get("concluida"):
+        # Nova passagem: o `from` fica no checkpoint, caso o token expire a meio
+        token, n = None, 0
+        inicio = max(filter(None, (desde, ultimo)), default=None)
+        checkpoint.atualizar(chave, token=None, registos=0, inicio=inicio, concluida=False)
+    else:
+        token = estado.get("token")
+        n = estado.get("registos", 0)
+        inicio = estado.get("inicio", desde)
+
+    paginas = 0
+    while True:
+        if token:
+            params = {"verb": "ListRecords", "resumptionToken": token}
+        else:
+            params = {"verb": "ListRecords", "metadataPrefix": "oai_dc"}
+            if set_spec:
+                params["set"] = set_spec
+            if inicio:
+                params["from"] = inicio
+            if ate:
+                params["until"] = ate
+
+        bucket.consumir()
+        xml = sickle.harvest(**params).xml
+        paginas += 1
+
+        erro = xml.find(OAI_NS + "error")
+        if erro is not None:
+            if erro.get("code") == "noRecordsMatch":
+                break
+            if erro.get("code") == "badResumptionToken" and token:
+                # O token expirou entre execuções: recomeçar a passagem do início
+                print(f"[{chave}] resumptionToken expirado, a recomeçar a partição.")
+                token, n = None, 0
+                continue
+            levantar_erro_oai(erro)
+
+        for elemento in xml.iter(OAI_NS + "record"):
+            record = Record(elemento)
+            with open(os.path.join(directory, nome_ficheiro(record.header.identifier)), "w", encoding="utf-8") as f:
+                f.write(str(record.raw))
+            # Datestamps ISO 8601 na mesma granularidade comparam-se como texto
+            ultimo = max(filter(None, (ultimo, record.header.datestamp)), default=None)
+            n += 1
+
+        token_el = xml.find(f".//{OAI_NS}resumptionToken")
+        token = token_el.text.strip() if token_el is not None and token_el.text else None
+        # Só depois da página estar em disco é que o token avança
+        checkpoint.atualizar(chave, token=token, registos=n, ultimo=ultimo, concluida=token is None)
+        if token is None:
+            break
+
+    checkpoint.atualizar(chave, token=None, registos=n, ultimo=ultimo, concluida=True)
+    return n, paginas
+
+
+def recolher(url=URL, directory="records", sets=None, janelas=None, workers=4, taxa=2.0, max_retries=3):
+    """Recolhe todas as partições em paralelo.
+
+    `sets` pode ser uma lista de setSpecs, "todos" (usa ListSets) ou None
+    (sem divisão por set); `janelas` é uma lista de pares (from, until).
+    Devolve o número total de registos e de páginas pedidas nesta execução.
+    """
+    os.makedirs(directory, exist_ok=True)
+    sickle = Sickle(url, max_retries=max_retries, timeout=60)
+    checkpoint = Checkpoint(os.path.join(directory, CHECKPOINT))
+    bucket = TokenBucket(taxa)
+
+    if sets == "todos":
+        sets = listar_sets(sickle)
+    particoes = [(s, desde, ate) for s in (sets or [None]) for desde, ate in (janelas or [(None, None)])]
+
+    inicio = time.perf_counter()
+    total = paginas = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futuros = {pool.submit(recolher_particao, sickle, directory, checkpoint, bucket, *p): p for p in particoes}
+        for futuro in as_completed(futuros):
+            n, p = futuro.result()
+            total += n
+            paginas += p
+            print(f"[{chave_particao(*futuros[futuro])}] {n} registos")
+
+    duracao = time.perf_counter() - inicio
+    print(f"{total} registos ({paginas} páginas) em {duracao:.1f}s - {total / max(duracao, 1e-9):.0f} registos/s")
+    return total, paginas
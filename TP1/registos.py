@@ -0,0 +1,109 @@
+"""Armazém único dos registos convertidos (SQLite), em vez de um YAML por registo.
+
+Cada registo (o dicionário de 2_estrutura.parse_record_to_dict) é guardado
+como JSON numa linha da tabela `registos`, com índices pelo `id` OAI e pelo
+código de referência `PT/...`. Ler o arquivo inteiro é uma só consulta e um
+`json.loads` por registo, muito mais rápido do que abrir e interpretar
+milhares de ficheiros YAML.
+
+    with Registos() as store:
+        store.get("PT/MVNF/AMAS/CSC/006-003")
+        for registo in store: ...
+
+A versão YAML para leitura humana continua disponível:
+
+    python3 registos.py yaml [records_yaml]
+"""
+import json
+import os
+import sqlite3
+import sys
+
+import yaml
+
+DB_REGISTOS = "registos.db"
+
+Dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+
+def codigo_referencia(registo):
+    """Primeiro identificador do tipo PT/... (código de referência arquivístico)."""
+    return next((i for i in registo.get('identificadores', []) if i.startswith('PT/')), None)
+
+
+class Registos:
+    def __init__(self, path=DB_REGISTOS):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS registos (
+                id TEXT PRIMARY KEY,
+                codigo TEXT,
+                ficheiro TEXT,
+                dados TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS registos_codigo ON registos(codigo)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS registos_ficheiro ON registos(ficheiro)")
+
+    def guardar(self, registos):
+        """Insere/substitui uma lista de pares (ficheiro, registo) numa só transação."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO registos (id, codigo, ficheiro, dados) VALUES (?, ?, ?, ?)",
+                ((r['id'], codigo_referencia(r), ficheiro, json.dumps(r, ensure_ascii=False))
+                 for ficheiro, r in registos))
+
+    def remover(self, ficheiros):
+        """Apaga os registos vindos dos ficheiros indicados (nomes sem extensão)."""
+        with self.conn:
+            self.conn.executemany("DELETE FROM registos WHERE ficheiro = ?", ((f,) for f in ficheiros))
+
+    def get(self, chave):
+        """Registo pelo id OAI ou pelo código PT/...; None se não existir."""
+        row = self.conn.execute(
+            "SELECT dados FROM registos WHERE id = ? UNION ALL SELECT dados FROM registos WHERE codigo = ? LIMIT 1",
+            (chave, chave)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def ficheiros(self):
+        """Dicionário código PT/... -> nome do ficheiro de origem (sem extensão)."""
+        return dict(self.conn.execute("SELECT codigo, ficheiro FROM registos WHERE codigo IS NOT NULL"))
+
+    def __iter__(self):
+        for (dados,) in self.conn.execute("SELECT dados FROM registos"):
+            yield json.loads(dados)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM registos").fetchone()[0]
+
+    def exportar_yaml(self, directory="records_yaml"):
+        """Escreve um ficheiro YAML por registo, com o nome do XML de origem."""
+        os.makedirs(directory, exist_ok=True)
+        n = 0
+        for ficheiro, dados in self.conn.execute("SELECT ficheiro, dados FROM registos"):
+            with open(os.path.join(directory, f"{ficheiro}.yaml"), "w", encoding="utf-8") as f:
+                f.write(yaml.dump(json.loads(dados), Dumper=Dumper, allow_unicode=True, sort_keys=False))
+            n += 1
+        return n
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("yaml", "get"):
+        print("uso: python3 registos.py yaml [diretoria] | get <id ou código PT/...>")
+        sys.exit(1)
+    with Registos() as store:
+        if sys.argv[1] == "yaml":
+            directory = sys.argv[2] if len(sys.argv) > 2 else "records_yaml"
+            print(f"{store.exportar_yaml(directory)} registos exportados para {directory}/")
+        else:
+            registo = store.get(sys.argv[2])
+            print(yaml.dump(registo, Dumper=Dumper, allow_unicode=True, sort_keys=False) if registo else "Não encontrado.")
@@ -0,0 +1,365 @@
+"""Site estático da árvore arquivística, em páginas de tamanho limitado.
+
+    python3 site_estatico.py [registos.db] [output/site]
+
+Em vez de um único index.html com a hierarquia inteira, cada nó com filhos
+(fundo, secção, série, ...) tem a sua página, com os filhos paginados
+(`POR_PAGINA` por página); os documentos aparecem nessas listagens com o
+código, as datas e a ligação para o registo original. Assim nenhuma página
+cresce com o tamanho do arquivo.
+
+A página inicial mostra só os fundos, também paginados (`index.html`,
+`index-2.html`, ...). A árvore expande-se no browser, carregando os filhos
+de cada nó a pedido (`arvore/<nó>.json`, também paginados), e a pesquisa usa um índice pré-construído, partido pelo
+prefixo de cada termo (`pesquisa/t-<prefixo>.json`) e com os documentos em
+blocos (`pesquisa/d<n>.json`). Os fragmentos começam nas duas primeiras
+letras e um fragmento maior do que `BYTES_POR_FRAGMENTO` é dividido pela
+letra seguinte; os documentos de um termo que sozinho passa esse tamanho
+são paginados (`pesquisa/p-<termo>.<k>.json`). A lista dos fragmentos
+(`pesquisa/fragmentos.json`) diz ao browser onde está cada termo, e ele só
+descarrega os bocados de que precisa.
+"""
+import html
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from arvore import ArchivalNode, arvore_de_registos, raizes
+from entidades import normalizar
+from registos import DB_REGISTOS, Registos, codigo_referencia
+
+POR_PAGINA = 200
+DOCS_POR_BLOCO = 1000
+# Tamanho máximo de cada ficheiro do índice de pesquisa
+BYTES_POR_FRAGMENTO = 64 * 1024
+
+# Termos depois de normalizar(); o mesmo padrão é usado no browser
+PALAVRA = re.compile(r"[a-z0-9]{2,}")
+
+CSS = """body { font-family: Arial, sans-serif; line-height: 1.5; margin: 20px; max-width: 60em; }
+nav.caminho, nav.paginas { margin: 1em 0; color: #555; }
+ul.filhos li, ul.arvore li { margin: .2em 0; }
+ul.arvore { list-style: none; padding-left: 1.2em; }
+.tipo { color: #777; font-size: .85em; }
+.codigo { font-family: monospace; color: #555; }
+button.expandir { border: none; background: none; cursor: pointer; width: 1.5em; }
+#resultados li { margin: .3em 0; }
+"""
+
+JS = """function normalizar(s) {
+  return s.normalize('NFKD').replace(/[\\u0300-\\u036f]/g, '').toLowerCase();
+}
+const cache = {};
+function obter(url) {
+  if (!cache[url]) cache[url] = fetch(url).then(r => r.json());
+  return cache[url];
+}
+function item(filho) {
+  const [rotulo, pagina, json] = filho;
+  const li = document.createElement('li');
+  if (json) {
+    const b = document.createElement('button');
+    b.className = 'expandir'; b.textContent = '+';
+    b.onclick = () => expandir(li, b, json);
+    li.appendChild(b);
+  }
+  const a = document.createElement(pagina ? 'a' : 'span');
+  if (pagina) a.href = pagina;
+  a.textContent = rotulo;
+  li.appendChild(a);
+  return li;
+}
+async function expandir(li, botao, json) {
+  const aberta = li.querySelector('ul');
+  if (aberta) { aberta.remove(); botao.textContent = '+'; return; }
+  botao.textContent = '-';
+  const ul = document.createElement('ul');
+  ul.className = 'arvore';
+  li.appendChild(ul);
+  await carregar(ul, json);
+}
+async function carregar(ul, json) {
+  const dados = await obter(json);
+  dados.filhos.forEach(f => ul.appendChild(item(f)));
+  if (dados.seguinte) {
+    const mais = document.createElement('li');
+    const b = document.createElement('button');
+    b.textContent = 'mais...';
+    b.onclick = () => { mais.remove(); carregar(ul, dados.seguinte); };
+    mais.appendChild(b);
+    ul.appendChild(mais);
+  }
+}
+let fragmentos = null;
+async function documentosDe(termo, prefixo) {
+  fragmentos = fragmentos || new Set(await obter('pesquisa/fragmentos.json'));
+  // O fragmento com o prefixo mais longo do termo e, por prefixo, os fragmentos mais específicos
+  let k = termo.length;
+  while (k >= 2 && !fragmentos.has(termo.slice(0, k))) k--;
+  const nomes = k >= 2 ? [termo.slice(0, k)] : [];
+  if (prefixo) fragmentos.forEach(f => { if (f.length > termo.length && f.startsWith(termo)) nomes.push(f); });
+  const encontrados = new Set();
+  for (const indice of await Promise.all(nomes.map(f => obter('pesquisa/t-' + f + '.json')))) {
+    for (const [t, docs] of Object.entries(indice)) {
+      if (t !== termo && !(prefixo && t.startsWith(termo))) continue;
+      const partes = Array.isArray(docs) ? [docs]
+        : await Promise.all([...Array(docs.partes).keys()].map(p => obter('pesquisa/p-' + t + '.' + p + '.json')));
+      partes.forEach(parte => parte.forEach(d => encontrados.add(d)));
+    }
+  }
+  return encontrados;
+}
+async function pesquisar(texto) {
+  const saida = document.getElementById('resultados');
+  saida.innerHTML = '';
+  const termos = normalizar(texto).match(/[a-z0-9]{2,}/g);
+  if (!termos) return;
+  let ids = null;
+  for (const [i, termo] of termos.entries()) {
+    // o último termo pode estar incompleto: procura por prefixo
+    const encontrados = await documentosDe(termo, i === termos.length - 1);
+    ids = ids === null ? encontrados : new Set([...ids].filter(d => encontrados.has(d)));
+  }
+  const primeiros = [...ids].sort((a, b) => a - b).slice(0, 50);
+  for (const id of primeiros) {
+    const bloco = await obter('pesquisa/d' + Math.floor(id / DOCS_POR_BLOCO) + '.json');
+    const [titulo, codigo, pagina] = bloco[id % DOCS_POR_BLOCO];
+    const li = document.createElement('li');
+    li.innerHTML = '<a></a> <span class="codigo"></span>';
+    li.firstChild.href = pagina; li.firstChild.textContent = titulo;
+    li.lastChild.textContent = codigo;
+    saida.appendChild(li);
+  }
+  document.getElementById('total').textContent = ids.size + ' resultado(s)';
+}
+"""
+
+
+def _json(dados) -> str:
+    return json.dumps(dados, ensure_ascii=False, separators=(",", ":"))
+
+
+def fragmentar(termos: Dict[str, List[int]], prefixo: str,
+               maximo: int = BYTES_POR_FRAGMENTO) -> Iterator[Tuple[str, Dict[str, List[int]]]]:
+    """
+    Parte os termos começados por `prefixo` em fragmentos (prefixo, {termo: docs}).
+
+    Um fragmento com mais de `maximo` bytes é dividido pela letra seguinte
+    dos termos; o termo igual ao próprio prefixo fica no fragmento do prefixo.
+    Só um fragmento com esse único termo pode passar de `maximo`.
+    """
+    if len(_json(termos)) <= maximo or all(len(t) == len(prefixo) for t in termos):
+        yield prefixo, termos
+        return
+    proprio, grupos = {}, {}
+    for termo, docs in termos.items():
+        if len(termo) == len(prefixo):
+            proprio[termo] = docs
+        else:
+            grupos.setdefault(termo[:len(prefixo) + 1], {})[termo] = docs
+    if proprio:
+        yield prefixo, proprio
+    for sub, grupo in sorted(grupos.items()):
+        yield from fragmentar(grupo, sub, maximo)
+
+
+def _slug(full_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", full_id)
+
+
+def _rotulo(node: ArchivalNode) -> str:
+    tipo_label = f" [{node.tipo}]" if node.tipo else ""
+    return f"{node.id}{tipo_label} {node.title}"
+
+
+def _navegacao(p: int, paginas: int, url: Callable[[int], str]) -> str:
+    """Ligações anterior/seguinte da página `p` de `paginas`; `url(k)` é o endereço da página k."""
+    navegacao = []
+    if p > 1:
+        navegacao.append(f"<a href='{url(p - 1)}'>&laquo; anterior</a>")
+    navegacao.append(f"página {p} de {paginas}")
+    if p < paginas:
+        navegacao.append(f"<a href='{url(p + 1)}'>seguinte &raquo;</a>")
+    return f"<nav class='paginas'>{' | '.join(navegacao)}</nav>"
+
+
+def _pagina(titulo: str, corpo: str, raiz: str = "../") -> str:
+    return (f"<!DOCTYPE html>\n<html><head><meta charset='UTF-8'><title>{html.escape(titulo)}</title>"
+            f"<link rel='stylesheet' href='{raiz}site.css'></head><body>\n{corpo}\n</body></html>\n")
+
+
+class SiteEstatico:
+    def __init__(self, nodes: Dict[str, ArchivalNode], registos: Dict[str, dict], output: str,
+                 por_pagina: int = POR_PAGINA):
+        self.nodes = nodes
+        self.registos = registos
+        self.output = output
+        self.por_pagina = por_pagina
+        self.slugs = {}
+        self._usados = set()
+        self.n_paginas = 0
+
+    def slug(self, node: ArchivalNode) -> str:
+        if node.full_id not in self.slugs:
+            slug = base = _slug(node.full_id)
+            k = 2
+            while slug in self._usados:
+                slug, k = f"{base}-{k}", k + 1
+            self.slugs[node.full_id] = slug
+            self._usados.add(slug)
+        return self.slugs[node.full_id]
+
+    def url(self, node: ArchivalNode, pagina: int = 1, json_: bool = False) -> str:
+        """Caminho relativo à raiz do site."""
+        sufixo = "" if pagina == 1 else f"-{pagina}"
+        return f"arvore/{self.slug(node)}{sufixo}.json" if json_ else f"n/{self.slug(node)}{sufixo}.html"
+
+    @staticmethod
+    def url_indice(pagina: int = 1) -> str:
+        """Página inicial `pagina` (a lista dos fundos), relativa à raiz do site."""
+        return "index.html" if pagina == 1 else f"index-{pagina}.html"
+
+    def _escrever(self, caminho: str, conteudo: str):
+        with open(os.path.join(self.output, caminho), "w", encoding="utf-8") as f:
+            f.write(conteudo)
+        self.n_paginas += 1
+
+    def _documento(self, node: ArchivalNode) -> str:
+        registo = self.registos.get(node.full_id, {})
+        datas = registo.get("datas") or {}
+        if datas.get("inicio"):
+            periodo = datas["inicio"] if datas["inicio"] == datas.get("fim") else f"{datas['inicio']}–{datas.get('fim')}"
+        else:
+            periodo = ""
+        ligacao = next((i for i in registo.get("identificadores", []) if i.startswith("http")), None)
+        titulo = html.escape(node.title)
+        if ligacao:
+            titulo = f"<a href='{html.escape(ligacao)}'>{titulo}</a>"
+        return (f"<li><span class='codigo'>{html.escape(node.id)}</span> <span class='tipo'>{html.escape(node.tipo or '')}</span> "
+                f"{titulo} <span class='tipo'>{html.escape(str(periodo))}</span></li>")
+
+    def _pagina_no(self, node: ArchivalNode):
+        # Caminho até à raiz
+        caminho = []
+        atual = self.nodes.get(node.parent_id)
+        while atual is not None:
+            caminho.append(f"<a href='../{self.url(atual)}'>{html.escape(atual.id)}</a>")
+            atual = self.nodes.get(atual.parent_id)
+        caminho = " / ".join(["<a href='../index.html'>Início</a>"] + caminho[::-1])
+
+        paginas = max(1, -(-len(node.children) // self.por_pagina))
+        for p in range(1, paginas + 1):
+            filhos = node.children[(p - 1) * self.por_pagina:p * self.por_pagina]
+            itens = []
+            for child in filhos:
+                if child.children:
+                    itens.append(f"<li><a href='../{self.url(child)}'>{html.escape(_rotulo(child))}</a> "
+                                 f"<span class='tipo'>({len(child.children)})</span></li>")
+                else:
+                    itens.append(self._documento(child))
+            corpo = (f"<nav class='caminho'>{caminho}</nav>\n<h1>{html.escape(_rotulo(node))}</h1>\n"
+                     f"<p class='codigo'>{html.escape(node.full_id)}</p>\n"
+                     f"<ul class='filhos'>\n" + "\n".join(itens) + "\n</ul>\n"
+                     + _navegacao(p, paginas, lambda k: f"../{self.url(node, k)}"))
+            self._escrever(self.url(node, p), _pagina(node.title, corpo))
+
+            # Os mesmos filhos em JSON, para expandir a árvore no browser
+            dados = {"filhos": [[_rotulo(c), self.url(c) if c.children else None,
+                                 self.url(c, json_=True) if c.children else None] for c in filhos],
+                     "seguinte": self.url(node, p + 1, json_=True) if p < paginas else None}
+            self._escrever(self.url(node, p, json_=True), json.dumps(dados, ensure_ascii=False, separators=(",", ":")))
+
+    def _indice(self):
+        # Os fundos, `por_pagina` por página, como os filhos em _pagina_no
+        roots = raizes(self.nodes)
+        paginas = max(1, -(-len(roots) // self.por_pagina))
+        for p in range(1, paginas + 1):
+            fundos = "\n".join(
+                f"<li><button class='expandir' onclick=\"expandir(this.parentNode, this, '{self.url(root, json_=True)}')\">+</button>"
+                f"<a href='{self.url(root)}'>{html.escape(_rotulo(root))}</a></li>" if root.children else
+                f"<li>{html.escape(_rotulo(root))}</li>" for root in roots[(p - 1) * self.por_pagina:p * self.por_pagina])
+            corpo = ("<h1>Árvore Arquivística</h1>\n"
+                     "<form onsubmit='pesquisar(this.q.value); return false'>"
+                     "<input name='q' type='search' placeholder='Pesquisar títulos...'> <button>Pesquisar</button> "
+                     "<span id='total'></span></form>\n<ul id='resultados'></ul>\n"
+                     f"<ul class='arvore'>\n{fundos}\n</ul>\n"
+                     + (_navegacao(p, paginas, self.url_indice) + "\n" if paginas > 1 else "") +
+                     f"<script>const DOCS_POR_BLOCO = {DOCS_POR_BLOCO};</script>\n<script src='site.js'></script>")
+            self._escrever(self.url_indice(p), _pagina("Árvore Arquivística", corpo, ""))
+
+    def _pesquisa(self):
+        # Documentos em blocos de DOCS_POR_BLOCO e termos partidos por prefixo (ver fragmentar)
+        documentos, termos = [], {}
+
+        def adicionar(node, pagina):
+            doc = len(documentos)
+            documentos.append((node.title, node.full_id, pagina))
+            for termo in set(PALAVRA.findall(normalizar(f"{node.title} {node.id}"))):
+                termos.setdefault(termo[:2], {}).setdefault(termo, []).append(doc)
+
+        # Fundos sem filhos só aparecem na página inicial onde estão listados
+        for i, root in enumerate(raizes(self.nodes)):
+            if not root.children:
+                adicionar(root, self.url_indice(i // self.por_pagina + 1))
+        for node in self.nodes.values():
+            if not node.children:
+                continue
+            adicionar(node, self.url(node))
+            # Os documentos apontam para a página do pai onde aparecem
+            for i, child in enumerate(node.children):
+                if not child.children:
+                    adicionar(child, self.url(node, i // self.por_pagina + 1))
+
+        for i in range(0, len(documentos), DOCS_POR_BLOCO):
+            self._escrever(f"pesquisa/d{i // DOCS_POR_BLOCO}.json", _json(documentos[i:i + DOCS_POR_BLOCO]))
+        prefixos = []
+        for inicio, grupo in sorted(termos.items()):
+            for prefixo, indice in fragmentar(grupo, inicio):
+                for termo, docs in indice.items():
+                    tamanho = len(_json(docs))
+                    if tamanho > BYTES_POR_FRAGMENTO:
+                        # Termo muito frequente: os seus documentos vão em partes
+                        partes = -(-tamanho // BYTES_POR_FRAGMENTO)
+                        por_parte = -(-len(docs) // partes)
+                        for k in range(partes):
+                            self._escrever(f"pesquisa/p-{termo}.{k}.json", _json(docs[k * por_parte:(k + 1) * por_parte]))
+                        indice[termo] = {"partes": partes}
+                self._escrever(f"pesquisa/t-{prefixo}.json", _json(indice))
+                prefixos.append(prefixo)
+        self._escrever("pesquisa/fragmentos.json", _json(prefixos))
+
+    def gerar(self):
+        if os.path.isdir(self.output):
+            shutil.rmtree(self.output)
+        for d in ("n", "arvore", "pesquisa"):
+            os.makedirs(os.path.join(self.output, d))
+        self._escrever("site.css", CSS)
+        self._escrever("site.js", JS)
+
+        for node in self.nodes.values():
+            if node.children:
+                self._pagina_no(node)
+        self._indice()
+        self._pesquisa()
+        return self.n_paginas
+
+
+def gerar_site(db: str = DB_REGISTOS, output: str = "output/site", por_pagina: int = POR_PAGINA) -> int:
+    """Gera o site em `output` a partir do armazém `db`; devolve o número de ficheiros escritos."""
+    nodes = arvore_de_registos(db)
+    with Registos(db) as store:
+        registos = {codigo_referencia(r): r for r in store}
+    return SiteEstatico(nodes, registos, output, por_pagina).gerar()
+
+
+if __name__ == "__main__":
+    db = sys.argv[1] if len(sys.argv) > 1 else DB_REGISTOS
+    output = sys.argv[2] if len(sys.argv) > 2 else "output/site"
+    inicio = time.perf_counter()
+    n = gerar_site(db, output)
+    print(f"{n} ficheiros gerados em {output}/ em {time.perf_counter() - inicio:.1f}s "
+          f"(abrir {output}/index.html a partir de um servidor, ex: python3 -m http.server -d {output})")
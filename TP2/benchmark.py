@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the TP2 pipeline.
+
+    python benchmark.py collect [n_records]
+    python benchmark.py transport [n_records]
+    python benchmark.py pipeline [n_records]
+    python benchmark.py process [n_records]
+    python benchmark.py extract [n_records]
+    python benchmark.py label [n_documents] [n_pairs]
+    python benchmark.py sample [n_documents] [n_pairs]
+    python benchmark.py training [n_documents] [n_pairs]
+
+Every benchmark runs against the local fake OAI-PMH server (fake_oai.py) and
+temporary directories. Runs that report peak RSS happen in a fresh process
+so the figure belongs to that run alone.
+"""
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+
+from fake_oai import FakeOAIServer
+
+
+def _measure(queue, func, args):
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def measure(func, *args):
+    """Run `func(*args)` in a child process; return (seconds, peak RSS in MB)."""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure, args=(queue, func, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _collect(url, output_dir, n_records, output_format):
+    from collect_data import RepositoriumCollector
+    collector = RepositoriumCollector(base_url=url, output_dir=output_dir, delay=0)
+    collector.collect_data(max_records=n_records, output_format=output_format)
+
+
+def bench_collect(n_records=20000):
+    results = []
+    with FakeOAIServer(n_records) as server, tempfile.TemporaryDirectory() as tmp:
+        for output_format in ("xml", "jsonl", "jsonl.gz"):
+            for n in (1000, n_records):
+                elapsed, rss = measure(_collect, server.url, tmp, n, output_format)
+                results.append((output_format, n, elapsed, rss))
+
+    print(f"\n{'format':<10}{'records':>10}{'seconds':>10}{'peak RSS (MB)':>16}")
+    for output_format, n, elapsed, rss in results:
+        print(f"{output_format:<10}{n:>10}{elapsed:>10.2f}{rss:>16.1f}")
+
+
+def bench_transport(n_records=5000):
+    from collect_data import RepositoriumCollector
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Every 7th request gets a 503 with Retry-After, like an overloaded DSpace
+        with FakeOAIServer(n_records, latency=0.01, unavailable_every=7, retry_after=0) as server:
+            collector = RepositoriumCollector(base_url=server.url, output_dir=tmp, delay=0, backoff=0.05)
+            collector.collect_data(max_records=n_records)
+            print(f"Server saw {server.requests_served} requests over {server.connections} TCP connections")
+
+        # Nightly refresh: only records with a datestamp from 2024 onwards
+        with FakeOAIServer(n_records, latency=0.01) as server:
+            collector = RepositoriumCollector(base_url=server.url, output_dir=tmp, delay=0)
+            collector.collect_data(max_records=n_records, from_date="2024-01-01")
+            print(f"Incremental harvest: {server.requests_served} requests for records changed since 2024-01-01, "
+                  f"merged into the full harvest")
+
+
+def bench_pipeline(n_records=5000):
+    from collect_data import RepositoriumCollector
+
+    results = []
+    with FakeOAIServer(n_records, latency=0.05) as server, tempfile.TemporaryDirectory() as tmp:
+        for prefetch in (0, 1, 2, 4):
+            collector = RepositoriumCollector(base_url=server.url, output_dir=tmp, delay=0)
+            start = time.perf_counter()
+            collector.collect_data(max_records=n_records, prefetch=prefetch)
+            results.append((prefetch, time.perf_counter() - start))
+
+    print(f"\n{'prefetch':<10}{'seconds':>10}{'records/s':>12}")
+    for prefetch, elapsed in results:
+        print(f"{prefetch:<10}{elapsed:>10.2f}{n_records / elapsed:>12.0f}")
+
+
+def _process_tree(data_dir):
+    # The previous xml_to_json: whole tree, document list, one indented json.dump
+    import json
+    import xml.etree.ElementTree as ET
+    from pathlib import Path
+    from process_data import DataProcessor
+
+    processor = DataProcessor()
+    processor.data_dir = Path(data_dir)
+    root = ET.parse(processor.data_dir / "col_1822_21316_data.xml").getroot()
+    documents = [m for m in (processor.extract_metadata(r) for r in root.findall('.//oai:record', processor.ns)) if m]
+    with open(processor.data_dir / "col_1822_21316_processed.json", 'w', encoding='utf-8') as f:
+        json.dump(documents, f, ensure_ascii=False, indent=2)
+
+
+def _process_stream(data_dir):
+    from pathlib import Path
+    from process_data import DataProcessor
+
+    processor = DataProcessor()
+    processor.data_dir = Path(data_dir)
+    for _ in processor.xml_to_json():
+        pass
+
+
+def bench_process(n_records=50000):
+    with tempfile.TemporaryDirectory() as tmp:
+        with FakeOAIServer(n_records) as server:
+            _collect(server.url, tmp, n_records, "xml")
+
+        results = [(name, *measure(func, tmp)) for name, func in (("tree", _process_tree),
+                                                                  ("iterparse", _process_stream))]
+
+    print(f"\n{'xml_to_json':<12}{'seconds':>10}{'records/s':>12}{'peak RSS (MB)':>16}")
+    for name, elapsed, rss in results:
+        print(f"{name:<12}{elapsed:>10.2f}{n_records / elapsed:>12.0f}{rss:>16.1f}")
+
+
+def bench_extract(n_records=100000):
+    import cProfile
+    import pstats
+    from pathlib import Path
+    from process_data import DOCUMENT_FIELDS, DataProcessor
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with FakeOAIServer(n_records) as server:
+            _collect(server.url, tmp, n_records, "xml")
+
+        for name, fields in (("all fields", None), ("DOCUMENT_FIELDS", DOCUMENT_FIELDS)):
+            processor = DataProcessor(fields=fields)
+            processor.data_dir = Path(tmp)
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            profile.enable()
+            for _ in processor.xml_to_json():
+                pass
+            profile.disable()
+            elapsed = time.perf_counter() - start
+            print(f"\n{name}: {n_records / elapsed:.0f} records/s (profiled)")
+            pstats.Stats(profile, stream=sys.stdout).sort_stats("tottime").print_stats(8)
+
+
+def synthetic_documents(n_documents):
+    """Documents as extract_metadata would return them for the fake server's records."""
+    from fake_oai import generate_records
+
+    documents = []
+    for record in generate_records(n_documents):
+        doc = {}
+        for schema, element, qualifier, value in record["fields"]:
+            key = f"{schema}.{element}" + (f".{qualifier}" if qualifier else "")
+            doc[key] = " ".join(value.split()).lower()
+        documents.append(doc)
+    return documents
+
+
+def bench_label(n_documents=50000, n_pairs=2000000):
+    import numpy as np
+    from process_data import DataProcessor
+    from similarity import SimilarityLabeller
+
+    documents = synthetic_documents(n_documents)
+    rng = np.random.default_rng(0)
+    left, right = rng.integers(n_documents, size=(2, n_pairs))
+
+    start = time.perf_counter()
+    labeller = SimilarityLabeller(documents)
+    tokenise = time.perf_counter() - start
+    start = time.perf_counter()
+    scores = labeller.scores(left, right)
+    vectorised = time.perf_counter() - start
+
+    # guess_similarity on a sample of the same pairs
+    processor = DataProcessor()
+    n_loop = min(n_pairs, 100000)
+    start = time.perf_counter()
+    reference = [processor.guess_similarity(documents[i], documents[j]) for i, j in zip(left[:n_loop], right[:n_loop])]
+    loop = time.perf_counter() - start
+
+    print(f"\n{n_documents} documents tokenised in {tokenise:.2f}s")
+    print(f"{'scorer':<20}{'pairs':>10}{'seconds':>10}{'pairs/s':>12}")
+    print(f"{'guess_similarity':<20}{n_loop:>10}{loop:>10.2f}{n_loop / loop:>12.0f}")
+    print(f"{'SimilarityLabeller':<20}{n_pairs:>10}{vectorised:>10.2f}{n_pairs / vectorised:>12.0f}")
+    print(f"identical scores: {np.array_equal(scores[:n_loop], reference)}")
+
+
+def bench_sample(n_documents=50000, n_pairs=1000000):
+    import os
+    import numpy as np
+    from sampling import PairSampler
+    from similarity import SimilarityLabeller
+
+    documents = synthetic_documents(n_documents)
+    labeller = SimilarityLabeller(documents)
+    buckets = 5
+
+    # The previous sampling: disjoint uniformly random pairs
+    indices = np.random.default_rng(0).permutation(n_documents)
+    scores = labeller.scores(indices[0::2][:n_documents // 2], indices[1::2][:n_documents // 2])
+    uniform = np.bincount(np.minimum((scores * buckets).astype(np.int64), buckets - 1), minlength=buckets)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "pairs.bin")
+        sampler = PairSampler(labeller, seed=42)
+        start = time.perf_counter()
+        written = sampler.sample_to_file(n_pairs, path, buckets)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path) / 2**20
+
+    print(f"\n{n_documents} documents, {buckets} buckets over [0, 1]")
+    print(f"disjoint random pairs per bucket: {uniform.tolist()}")
+    print(f"stratified pairs per bucket:      {sampler.bucket_counts.tolist()}")
+    print(f"{written} pairs in {elapsed:.2f}s ({written / elapsed:.0f} pairs/s), {size:.1f}MB on disk")
+
+
+def _load_json(path):
+    # The notebook before training_data.npz: json.load, then one row per pair for the DataFrame
+    import json
+
+    with open(path, encoding='utf-8') as f:
+        training_data = json.load(f)
+    rows = [{"abstract1": item[0], "abstract2": item[1], "similarity": float(item[2])} for item in training_data]
+    for row in rows:
+        (row["abstract1"], row["abstract2"], row["similarity"])
+
+
+def _load_npz(path):
+    from training_data import TrainingData
+
+    for _ in TrainingData.load(path).batches(16):
+        pass
+
+
+def bench_training(n_documents=20000, n_pairs=200000):
+    import json
+    import os
+    from sampling import PairSampler
+    from similarity import SimilarityLabeller
+    from training_data import TrainingData
+
+    documents = synthetic_documents(n_documents)
+    # Give every document its own abstract
+    for doc in documents:
+        doc["dc.description.abstract"] = f'{doc["dc.title"]}. {doc["dc.description.abstract"]}'
+    abstracts = [doc["dc.description.abstract"] for doc in documents]
+    pairs = PairSampler(SimilarityLabeller(documents), seed=42).sample(n_pairs)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        json_file, npz_file = os.path.join(tmp, "training_data.json"), os.path.join(tmp, "training_data.npz")
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump([[abstracts[l], abstracts[r], s] for l, r, s in pairs.tolist()], f, ensure_ascii=False, indent=2)
+        TrainingData.from_documents(abstracts, pairs['left'], pairs['right'], pairs['score']).save(npz_file)
+
+        for name, path, load in (("json", json_file, _load_json), ("npz", npz_file, _load_npz)):
+            elapsed, rss = measure(load, path)
+            results.append((name, os.path.getsize(path) / 2**20, elapsed, rss))
+
+    print(f"\n{len(pairs)} pairs over {n_documents} documents, loaded and read once")
+    print(f"{'format':<8}{'file (MB)':>12}{'seconds':>10}{'peak RSS (MB)':>16}")
+    for name, size, elapsed, rss in results:
+        print(f"{name:<8}{size:>12.1f}{elapsed:>10.2f}{rss:>16.1f}")
+
+
+BENCHMARKS = {
+    "collect": bench_collect,
+    "transport": bench_transport,
+    "pipeline": bench_pipeline,
+    "process": bench_process,
+    "extract": bench_extract,
+    "label": bench_label,
+    "sample": bench_sample,
+    "training": bench_training,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"usage: python benchmark.py {{{','.join(BENCHMARKS)}}} [n_records]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*(int(a) for a in sys.argv[2:]))
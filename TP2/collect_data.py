@@ -1,78 +1,413 @@
 #!/usr/bin/env python3
+import gzip
+import json
+import os
+import random
 import requests
+import sys
+import threading
 import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 
+OAI_NS = "http://www.openarchives.org/OAI/2.0/"
+DIM_NS = "http://www.dspace.org/xmlns/dspace/dim"
+
+ET.register_namespace("oai", OAI_NS)
+ET.register_namespace("dim", DIM_NS)
+
+
+class RecordWriter:
+    """
+    Base of the page-by-page record writers.
+
+    Opens the output file with `open` (overridden for compressed output),
+    closes it on `close` or when leaving a `with` block, and leaves the
+    format to the subclasses (`write_page` and `read`).
+    """
+    extension = ""
+
+    def __init__(self, path: Path):
+        self.file = self.open(path, "wt")
+
+    @staticmethod
+    def open(path: Path, mode: str):
+        return open(path, mode, encoding="utf-8")
+
+    def write_page(self, records):
+        raise NotImplementedError
+
+    @classmethod
+    def read(cls, path: Path):
+        raise NotImplementedError
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class XMLStreamWriter(RecordWriter):
+    """
+    Writes records into a <repository> document page by page.
+
+    Each page is flushed as soon as it arrives and the closing tag is written
+    on close, even when the collection is interrupted by an exception, so a
+    partial run still yields a well-formed file.
+    """
+    extension = ".xml"
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self.file.write("<?xml version='1.0' encoding='utf-8'?>\n<repository>\n")
+
+    def write_page(self, records):
+        for record in records:
+            self.file.write(ET.tostring(record, encoding="unicode"))
+            self.file.write("\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.write("</repository>\n")
+        super().close()
+
+    @classmethod
+    def read(cls, path: Path):
+        """Yield the <record> elements of a file written by this class, one at a time."""
+        record_tag = f"{{{OAI_NS}}}record"
+        context = ET.iterparse(path, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event == "end" and elem.tag == record_tag:
+                yield elem
+                root.remove(elem)
+
+
+class JSONLinesWriter(RecordWriter):
+    """
+    Writes one JSON object per record (identifier, datestamp and the raw
+    record XML). Every line is self-contained, so a truncated file is usable
+    up to its last complete line.
+    """
+    extension = ".jsonl"
+
+    @classmethod
+    def read(cls, path: Path):
+        with cls.open(path, "rt") as f:
+            for line in f:
+                if line.strip():
+                    yield ET.fromstring(json.loads(line)["xml"])
+
+    def write_page(self, records):
+        for record in records:
+            header = record.find(f"{{{OAI_NS}}}header")
+            line = {
+                "identifier": header.findtext(f"{{{OAI_NS}}}identifier") if header is not None else None,
+                "datestamp": header.findtext(f"{{{OAI_NS}}}datestamp") if header is not None else None,
+                "xml": ET.tostring(record, encoding="unicode"),
+            }
+            self.file.write(json.dumps(line, ensure_ascii=False))
+            self.file.write("\n")
+        self.file.flush()
+
+
+class GzipJSONLinesWriter(JSONLinesWriter):
+    """
+    JSON Lines compressed with gzip. The per-page flush is a zlib sync flush,
+    so a truncated file still decompresses up to the last complete page.
+    """
+    extension = ".jsonl.gz"
+
+    @staticmethod
+    def open(path: Path, mode: str):
+        return gzip.open(path, mode, encoding="utf-8")
+
+
+class OAITransport:
+    """
+    HTTP transport for OAI-PMH requests.
+
+    Uses one pooled keep-alive session instead of a new connection per page,
+    and retries connection errors and 429/5xx responses with exponential
+    backoff plus jitter. A `Retry-After` header (seconds or HTTP date), as
+    sent by DSpace with a 503, takes precedence over the backoff.
+    """
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url, max_retries=5, backoff=1.0, max_backoff=60.0, pool_size=4, timeout=60):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # get() runs on the prefetch threads, so the shared counter needs a lock
+        self.lock = threading.Lock()
+        self.total_requests = 0
+
+    def backoff_delay(self, attempt):
+        """Full jitter: a random delay up to backoff * 2^attempt, capped."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, params):
+        """
+        Perform a GET with retries.
+
+        Returns:
+            tuple: (response, stats) where stats holds the number of HTTP
+            requests made and the total latency in seconds, retries included.
+        """
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            with self.lock:
+                self.total_requests += 1
+            try:
+                response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+            else:
+                if response.status_code not in self.RETRY_STATUS or attempt == self.max_retries:
+                    response.raise_for_status()
+                    stats = {"requests": attempt + 1, "latency": time.perf_counter() - start}
+                    return response, stats
+                delay = self.retry_after(response)
+                if delay is None:
+                    delay = self.backoff_delay(attempt)
+                delay = min(delay, self.max_backoff)
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+
+WRITERS = {
+    "xml": XMLStreamWriter,
+    "jsonl": JSONLinesWriter,
+    "jsonl.gz": GzipJSONLinesWriter,
+}
+
+
 class RepositoriumCollector:
-    def __init__(self):
-        self.base_url = "https://repositorium.sdum.uminho.pt/oai/oai"
-        self.output_dir = Path("data")
+    def __init__(self, base_url="https://repositorium.sdum.uminho.pt/oai/oai", output_dir="data", delay=1.0, **transport_options):
+        self.base_url = base_url
+        self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
-        
-    def collect_data(self, collection="col_1822_21316", batch_size=100, max_records=1000):
+        self.delay = delay
+        self.transport = OAITransport(base_url, **transport_options)
+        self.page_stats = []
+
+    def state_file(self, collection):
+        return self.output_dir / f"{collection}_state.json"
+
+    def last_harvest(self, collection):
+        """Date (YYYY-MM-DD) of the last complete harvest of `collection`, if any."""
+        state_file = self.state_file(collection)
+        if not state_file.exists():
+            return None
+        with open(state_file, encoding="utf-8") as f:
+            return json.load(f).get("last_harvest")
+
+    def page_params(self, collection, offset, from_date=None):
+        # DSpace tokens are metadataPrefix/from/until/set/offset
+        return {
+            "verb": "ListRecords",
+            "resumptionToken": f"dim/{from_date or ''}//{collection}/{offset}"
+        }
+
+    def collect_data(self, collection="col_1822_21316", batch_size=100, max_records=1000, output_format="xml",
+                     from_date=None, incremental=False, prefetch=2):
         """
-        Collect data from RepositoriUM using OAI-PMH protocol
+        Collect data from RepositoriUM using OAI-PMH protocol.
+
+        Records are streamed to disk one page at a time, so memory use does not
+        depend on `max_records` and an interrupted run keeps what was already
+        collected.
+
+        With `from_date` (or `incremental=True`, which uses the date of the last
+        complete harvest) only records created or changed since that datestamp
+        are requested. They are written to `{collection}_data.since-{date}` and
+        then merged into the full harvest by OAI identifier (see `merge`), so
+        process_data.py picks up the refresh from the usual file.
+
+        Fetching and parsing are pipelined: since the token offsets are known
+        up front, up to `prefetch` following pages are requested by worker
+        threads while the current one is parsed and written. The queue of
+        pending pages is bounded by `prefetch`, so a slow writer holds back the
+        fetchers. `prefetch=0` is the old strictly sequential behaviour; keep
+        it at or below the transport's `pool_size`.
         
         Args:
             collection (str): Collection identifier
             batch_size (int): Number of records per request
             max_records (int): Maximum number of records to collect
+            output_format (str): One of "xml", "jsonl" or "jsonl.gz"
+            from_date (str): OAI `from` datestamp (YYYY-MM-DD)
+            incremental (bool): Use the last harvest date as `from_date`
+            prefetch (int): Pages in flight while the current one is parsed
+
+        Returns:
+            Path: The output file (the since-file for an incremental run)
         """
-        xml_file = self.output_dir / f"{collection}_data.xml"
-        
-        # Initialize XML structure
-        root = ET.Element("repository")
-        tree = ET.ElementTree(root)
+        if incremental and from_date is None:
+            from_date = self.last_harvest(collection)
+        started_at = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+        writer_class = WRITERS[output_format]
+        suffix = f".since-{from_date}" if from_date else ""
+        output_file = self.output_dir / f"{collection}_data{suffix}{writer_class.extension}"
         
-        offset = 0
         total_records = 0
+        complete = False
+        self.page_stats = []
         pbar = tqdm(total=max_records, desc="Collecting records")
+
+        offsets = iter(range(0, max_records, batch_size))
+        in_flight = deque()
         
-        while total_records < max_records:
-            params = {
-                "verb": "ListRecords",
-                "resumptionToken": f"dim///{collection}/{offset}"
-            }
-            
-            try:
-                response = requests.get(self.base_url, params=params)
-                response.raise_for_status()
-                
-                if "noRecordsMatch" in response.text:
-                    print(f"\nNo more records found after {total_records} records.")
-                    break
-                
-                # Parsing response XML
-                response_root = ET.fromstring(response.text)
-                records = response_root.findall(".//{http://www.openarchives.org/OAI/2.0/}record")
-                
-                if not records:
-                    break
+        with writer_class(output_file) as writer, ThreadPoolExecutor(max_workers=max(prefetch, 1)) as pool:
+            def top_up(depth):
+                while len(in_flight) < depth:
+                    offset = next(offsets, None)
+                    if offset is None:
+                        return
+                    params = self.page_params(collection, offset, from_date)
+                    in_flight.append((offset, pool.submit(self.transport.get, params)))
+
+            top_up(max(prefetch, 1))
+            while in_flight and total_records < max_records:
+                offset, future = in_flight.popleft()
+                # Pages N+1..N+prefetch go out while page N is awaited and parsed
+                top_up(prefetch)
                 
-                # Adding records to XML
-                for record in records:
-                    root.append(record)
-                    total_records += 1
-                    pbar.update(1)
+                try:
+                    response, stats = future.result()
+                    self.page_stats.append({"offset": offset, **stats})
+                    pbar.set_postfix(latency=f"{stats['latency']:.2f}s", requests=stats["requests"])
                     
-                    if total_records >= max_records:
+                    if "noRecordsMatch" in response.text:
+                        print(f"\nNo more records found after {total_records} records.")
+                        complete = True
                         break
-                
-                offset += batch_size
-                time.sleep(1)  # I'm being nice to the server :3
-                
-            except requests.exceptions.RequestException as e:
-                print(f"\nError during collection: {e}")
-                break
+                    
+                    # Parsing response XML
+                    response_root = ET.fromstring(response.text)
+                    records = response_root.findall(f".//{{{OAI_NS}}}record")
+                    
+                    if not records:
+                        complete = True
+                        break
+                    
+                    # Writing this page straight to disk
+                    records = records[:max_records - total_records]
+                    writer.write_page(records)
+                    total_records += len(records)
+                    pbar.update(len(records))
+                    
+                    time.sleep(self.delay)  # I'm being nice to the server :3
+                    top_up(1)
+                    
+                except requests.exceptions.RequestException as e:
+                    print(f"\nError during collection: {e}")
+                    break
+
+            # Pages requested past the end of the collection are not needed
+            for _, future in in_flight:
+                future.cancel()
                 
         pbar.close()
-        
-        # Saving the collected data
-        tree.write(xml_file, encoding="utf-8", xml_declaration=True)
-        print(f"\nData collection completed. Saved {total_records} records to {xml_file}")
+        if complete:
+            with open(self.state_file(collection), "w", encoding="utf-8") as f:
+                json.dump({"last_harvest": started_at}, f)
+
+        print(f"\nData collection completed. Saved {total_records} records to {output_file}")
+        self.report()
+        if from_date and total_records:
+            self.merge(collection, output_file, output_format)
+        return output_file
+
+    def merge(self, collection, since_file, output_format="xml", page_size=1000):
+        """
+        Merge an incremental harvest into `{collection}_data`, by OAI identifier.
+
+        The full harvest is streamed into a new file without the records that
+        appear in `since_file`, the changed records are appended (records the
+        repository marks as deleted are dropped) and the new file replaces the
+        old one. Only the changed records are held in memory.
+
+        Args:
+            collection (str): Collection identifier
+            since_file (Path): Output of an incremental `collect_data`
+            output_format (str): Format of both files
+            page_size (int): Records written per page
+
+        Returns:
+            Path: The merged file
+        """
+        writer_class = WRITERS[output_format]
+        output_file = self.output_dir / f"{collection}_data{writer_class.extension}"
+        identifier_path = f"{{{OAI_NS}}}header/{{{OAI_NS}}}identifier"
+        changed = {record.findtext(identifier_path): record for record in writer_class.read(since_file)}
+
+        kept = 0
+        tmp_file = output_file.with_name(output_file.name + ".tmp")
+        with writer_class(tmp_file) as writer:
+            if output_file.exists():
+                page = []
+                for record in writer_class.read(output_file):
+                    if record.findtext(identifier_path) not in changed:
+                        page.append(record)
+                    if len(page) == page_size:
+                        writer.write_page(page)
+                        kept += len(page)
+                        page = []
+                writer.write_page(page)
+                kept += len(page)
+            deleted_path = f"{{{OAI_NS}}}header[@status='deleted']"
+            writer.write_page(record for record in changed.values() if record.find(deleted_path) is None)
+        os.replace(tmp_file, output_file)
+
+        print(f"Merged {len(changed)} changed records into {output_file} ({kept} unchanged)")
+        return output_file
+
+    def report(self):
+        """Print request counts and latency over the pages of the last run."""
+        if not self.page_stats:
+            return
+        latencies = sorted(page["latency"] for page in self.page_stats)
+        requests_made = sum(page["requests"] for page in self.page_stats)
+        print(f"Pages: {len(self.page_stats)}, HTTP requests: {requests_made} "
+              f"({requests_made - len(self.page_stats)} retries)")
+        print(f"Page latency: mean {sum(latencies) / len(latencies):.3f}s, "
+              f"p50 {latencies[len(latencies) // 2]:.3f}s, max {latencies[-1]:.3f}s")
 
 if __name__ == "__main__":
     collector = RepositoriumCollector()
-    collector.collect_data()
+    collector.collect_data(incremental="--incremental" in sys.argv)
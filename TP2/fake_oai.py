@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Local fake of the RepositoriUM OAI-PMH endpoint, used to benchmark the
+collector and the processing stages offline.
+
+It serves synthetic DSpace Intermediate Metadata (dim) records and understands
+the same `{prefix}/{from}/{until}/{set}/{offset}` resumption tokens that
+RepositoriumCollector builds (e.g. `dim///col_1822_21316/200`).
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+          '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+          '<responseDate>2025-01-01T00:00:00Z</responseDate>'
+          '<request verb="ListRecords">{url}</request>')
+
+TOPICS = [
+    ("natural language processing", "004.8", "Engenharia e Tecnologia::Engenharia Eletrotécnica, Eletrónica e Informática"),
+    ("web performance optimization", "004.7", "Ciências Naturais::Ciências da Computação e da Informação"),
+    ("machine learning", "004.85", "Ciências Naturais::Ciências da Computação e da Informação"),
+    ("ubiquitous computing", "004.5", "Engenharia e Tecnologia::Engenharia Eletrotécnica, Eletrónica e Informática"),
+    ("software engineering", "004.41", "Engenharia e Tecnologia::Outras Engenharias e Tecnologias"),
+    ("databases", "004.65", "Ciências Naturais::Ciências da Computação e da Informação"),
+]
+
+
+def generate_records(n_records, start_year=2015):
+    """Generate `n_records` dicts with the fields the server serialises."""
+    records = []
+    for i in range(n_records):
+        topic, udc, fos = TOPICS[i % len(TOPICS)]
+        other, _, _ = TOPICS[(i // len(TOPICS)) % len(TOPICS)]
+        records.append({
+            "identifier": f"oai:repositorium.sdum.uminho.pt:1822/{10000 + i}",
+            "datestamp": f"{start_year + i % 10}-{1 + i % 12:02d}-{1 + i % 28:02d}T00:00:00Z",
+            "fields": [
+                ("dc", "title", None, f"A study on {topic} number {i}"),
+                ("dc", "contributor", "author", f"Autor {i % 97}"),
+                ("dc", "description", "abstract",
+                 f"This dissertation addresses {topic} and {other}. " * (3 + i % 5)),
+                ("dc", "subject", None, f"{topic} {other}"),
+                ("dc", "subject", "udc", udc),
+                ("dc", "subject", "fos", fos),
+                ("dc", "relation", "ispartof", f"Dissertação {i % 3}"),
+                ("dc", "date", "issued", str(start_year + i % 10)),
+            ],
+        })
+    return records
+
+
+class FakeOAIServer:
+    """Threaded fake OAI-PMH server; use it as a context manager.
+
+    `latency` delays every response (seconds) to simulate the network and
+    `unavailable_every` answers every n-th request with a 503 carrying a
+    `Retry-After` of `retry_after` seconds, like an overloaded DSpace.
+    """
+
+    def __init__(self, n_records=1000, page_size=100, latency=0.0, unavailable_every=None, retry_after=0):
+        self.records = generate_records(n_records)
+        self.page_size = page_size
+        self.latency = latency
+        self.unavailable_every = unavailable_every
+        self.retry_after = retry_after
+        self.requests_served = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/oai/oai"
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def render_record(self, record):
+        fields = []
+        for schema, element, qualifier, value in record["fields"]:
+            qualifier_attr = f' qualifier="{qualifier}"' if qualifier else ""
+            fields.append(f'<dim:field mdschema="{schema}" element="{element}"{qualifier_attr}>'
+                          f'{escape(value)}</dim:field>')
+        return (f'<record><header><identifier>{record["identifier"]}</identifier>'
+                f'<datestamp>{record["datestamp"]}</datestamp></header>'
+                f'<metadata><dim:dim xmlns:dim="http://www.dspace.org/xmlns/dspace/dim">'
+                f'{"".join(fields)}</dim:dim></metadata></record>')
+
+    def respond(self, params):
+        """Return (status, headers, body) for the OAI parameters of a request."""
+        header = HEADER.format(url=escape(self.url))
+        token = params.get("resumptionToken", "")
+        try:
+            _, since, until, _, offset = token.split("/") if token else ("", "", "", "", "0")
+            offset = int(offset)
+        except ValueError:
+            return 200, {}, f'{header}<error code="badResumptionToken">{escape(token)}</error></OAI-PMH>'
+
+        records = [r for r in self.records
+                   if (not since or r["datestamp"][:len(since)] >= since)
+                   and (not until or r["datestamp"][:len(until)] <= until)]
+        page = records[offset:offset + self.page_size]
+        if not page:
+            return 200, {}, f'{header}<error code="noRecordsMatch">No records</error></OAI-PMH>'
+
+        body = [header, "<ListRecords>"]
+        body.extend(self.render_record(r) for r in page)
+        body.append("</ListRecords></OAI-PMH>")
+        return 200, {}, "".join(body)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def do_GET(self):
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                with server._lock:
+                    server.requests_served += 1
+                    unavailable = server.unavailable_every and server.requests_served % server.unavailable_every == 0
+                if server.latency:
+                    time.sleep(server.latency)
+                if unavailable:
+                    status, headers, body = 503, {"Retry-After": str(server.retry_after)}, "Service Unavailable"
+                else:
+                    status, headers, body = server.respond(params)
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/xml; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
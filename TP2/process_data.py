@@ -2,77 +2,146 @@
 import json
 import xml.etree.ElementTree as ET
 from pathlib import Path
-import re
+import sys
 from collections import Counter
-from typing import List, Dict, Tuple
-import numpy as np
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional
+
+from sampling import PairSampler, read_pairs
+from similarity import SimilarityLabeller
+from training_data import TrainingData
+
+# The only fields create_training_collection reads from a document
+TRAINING_FIELDS = ('dc.description.abstract', 'dc.subject', 'dc.subject.udc', 'dc.subject.fos',
+                   'dc.relation.ispartof')
+
+# Fields kept in {collection}_processed.jsonl: the training fields plus what the notebook shows
+DOCUMENT_FIELDS = ('dc.title', 'dc.contributor.author') + TRAINING_FIELDS
 
 class DataProcessor:
-    def __init__(self):
+    def __init__(self, fields: Optional[Iterable[str]] = None):
+        """
+        Args:
+            fields (Iterable[str], optional): Whitelist of `mdschema.element[.qualifier]`
+                keys to extract. Other fields are skipped before their text is
+                cleaned. Defaults to every field.
+        """
         self.data_dir = Path("data")
         self.ns = {
             'oai': 'http://www.openarchives.org/OAI/2.0/',
             'dim': 'http://www.dspace.org/xmlns/dspace/dim'
         }
+        self.field_tag = f"{{{self.ns['dim']}}}field"
+        self.fields = None if fields is None else frozenset(fields)
+        # Pairs per similarity bucket of the last create_training_collection
+        self.bucket_counts = None
+        # (mdschema, element, qualifier) attributes -> interned key, or None for unwanted fields
+        self.keys = {}
+        for key in self.fields or ():
+            mdschema, _, rest = key.partition('.')
+            element, _, qualifier = rest.partition('.')
+            self.keys[(mdschema, element, qualifier)] = sys.intern(key)
+
+    def field_key(self, mdschema: str, element: str, qualifier: str) -> Optional[str]:
+        """Key of a dim:field with these attributes, or None if it is not in the whitelist."""
+        key = f"{mdschema}.{element}"
+        if qualifier:
+            key += f".{qualifier}"
+        if self.fields is not None and key not in self.fields:
+            return None
+        return sys.intern(key)
         
     def clean_text(self, text: str) -> str:
         """Clean and normalize text."""
         if not text:
             return ""
-        # Removing extra whitespace and normalize
-        text = re.sub(r'\s+', ' ', text).strip()
+        # Removing extra whitespace and normalize (split() is the same as re.sub(r'\s+', ' ', text).strip())
+        text = " ".join(text.split())
         # Converting to lowercase
         return text.lower()
     
     def extract_metadata(self, record: ET.Element) -> Dict:
-        """Extract relevant metadata from a record."""
-        metadata = {}
-        
+        """
+        Extract relevant metadata from a record.
+
+        A field that occurs once maps to its cleaned text and a repeated field
+        to the list of its values, in document order. Fields outside the
+        whitelist are skipped without being cleaned.
+        """
+        values = {}
+        keys = self.keys
+
         # Finding all fields in DSpace Intermediate Metadata format
-        fields = record.findall('.//dim:field', self.ns)
-        
-        for field in fields:
-            mdschema = field.get('mdschema', '')
-            element = field.get('element', '')
-            qualifier = field.get('qualifier', '')
-            
-            key = f"{mdschema}.{element}"
-            if qualifier:
-                key += f".{qualifier}"
-                
+        for field in record.iter(self.field_tag):
+            attrs = (field.get('mdschema', ''), field.get('element', ''), field.get('qualifier', ''))
+            try:
+                key = keys[attrs]
+            except KeyError:
+                key = keys[attrs] = self.field_key(*attrs)
+            if key is None:
+                continue
+
             value = self.clean_text(field.text)
-            
-            if key in metadata:
-                if isinstance(metadata[key], list):
-                    metadata[key].append(value)
-                else:
-                    metadata[key] = [metadata[key], value]
+            if key in values:
+                values[key].append(value)
             else:
-                metadata[key] = value
-                
-        return metadata
+                values[key] = [value]
+
+        return {key: value[0] if len(value) == 1 else value for key, value in values.items()}
     
-    def xml_to_json(self, collection: str = "col_1822_21316") -> List[Dict]:
-        """Convert XML data to JSON format."""
+    def iter_records(self, xml_file: Path) -> Iterator[Dict]:
+        """
+        Stream the metadata of every <record> in `xml_file`.
+
+        Records are parsed one at a time with iterparse and dropped from the
+        tree as soon as their metadata is extracted, so memory does not grow
+        with the size of the file.
+        """
+        record_tag = f"{{{self.ns['oai']}}}record"
+        parents = []
+        for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+            if event == "start":
+                parents.append(elem)
+                continue
+            parents.pop()
+            if elem.tag == record_tag:
+                metadata = self.extract_metadata(elem)
+                if parents:
+                    parents[-1].remove(elem)
+                elem.clear()
+                if metadata:
+                    yield metadata
+
+    def iter_documents(self, collection: str = "col_1822_21316") -> Iterator[Dict]:
+        """Lazily read the documents written by xml_to_json, one line at a time."""
+        json_file = self.data_dir / f"{collection}_processed.jsonl"
+        with open(json_file, encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def xml_to_json(self, collection: str = "col_1822_21316") -> Iterator[Dict]:
+        """
+        Convert XML data to JSON Lines, one document per line.
+
+        Each document is written as soon as its record is parsed, so peak
+        memory is a single record instead of the tree, the document list and
+        the serialised JSON of the whole collection.
+
+        Returns:
+            Iterator[Dict]: A lazy iterator over the converted documents
+            (see `iter_documents`).
+        """
         xml_file = self.data_dir / f"{collection}_data.xml"
         if not xml_file.exists():
             raise FileNotFoundError(f"XML file not found: {xml_file}")
-            
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        
-        documents = []
-        for record in root.findall('.//oai:record', self.ns):
-            metadata = self.extract_metadata(record)
-            if metadata:  
-                documents.append(metadata)
-                
-        # Saving to JSON
-        json_file = self.data_dir / f"{collection}_processed.json"
+
+        # Saving to JSON Lines
+        json_file = self.data_dir / f"{collection}_processed.jsonl"
         with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(documents, f, ensure_ascii=False, indent=2)
-            
-        return documents
+            for metadata in self.iter_records(xml_file):
+                f.write(json.dumps(metadata, ensure_ascii=False))
+                f.write("\n")
+
+        return self.iter_documents(collection)
     
     def guess_similarity(self, doc1: Dict, doc2: Dict) -> float:
         """
@@ -112,34 +181,45 @@ class DataProcessor:
             
         return score
     
-    def create_training_collection(self, documents: List[Dict], sample_size: int = 1000) -> List[List]:
-        """Create training collection of document pairs with similarity scores."""
-        training_data = []
-        
-        # Random pairs
-        indices = np.random.choice(len(documents), min(sample_size * 2, len(documents)), replace=False)
-        
-        for i in range(0, len(indices) - 1, 2):
-            doc1 = documents[indices[i]]
-            doc2 = documents[indices[i + 1]]
-            
-            abstract1 = doc1.get('dc.description.abstract', '')
-            abstract2 = doc2.get('dc.description.abstract', '')
-            
-            if abstract1 and abstract2: 
-                sim_score = self.guess_similarity(doc1, doc2)
-                # Ensure consistent data structure: always use a list with two elements and a score
-                training_data.append([abstract1, abstract2, sim_score])
-                
+    def create_training_collection(self, documents: Iterable[Dict], sample_size: int = 1000,
+                                   seed: Optional[int] = None, buckets: int = 5) -> TrainingData:
+        """
+        Create training collection of document pairs with similarity scores.
+
+        Pairs are drawn by PairSampler: candidates sharing subject/UDC/FOS
+        tokens plus random pairs, balanced over `buckets` score ranges. They
+        are streamed round by round to data/training_pairs.bin and read back
+        memory-mapped, so the sampled chunks are never held in memory at
+        once. The collection is saved to data/training_data.npz (see
+        training_data.py), with every abstract stored once.
+
+        Args:
+            documents (Iterable[Dict]): Documents from xml_to_json.
+            sample_size (int): Number of pairs wanted.
+            seed (int, optional): Seed for a reproducible collection.
+            buckets (int): Equal-width similarity buckets over [0, 1].
+        """
+        # Only documents with an abstract can form a pair, and only the fields used below are kept
+        documents = [{k: doc[k] for k in TRAINING_FIELDS if k in doc}
+                     for doc in documents if doc.get('dc.description.abstract', '')]
+
+        sampler = PairSampler(SimilarityLabeller(documents), seed=seed)
+        pairs_file = self.data_dir / "training_pairs.bin"
+        sampler.sample_to_file(sample_size, pairs_file, buckets)
+        self.bucket_counts = sampler.bucket_counts.tolist()
+        pairs = read_pairs(pairs_file)
+
+        training_data = TrainingData.from_documents([doc['dc.description.abstract'] for doc in documents],
+                                                    pairs['left'], pairs['right'], pairs['score'])
+
         # Saving training data
-        train_file = self.data_dir / "training_data.json"
-        with open(train_file, 'w', encoding='utf-8') as f:
-            json.dump(training_data, f, ensure_ascii=False, indent=2)
-            
+        training_data.save(self.data_dir / "training_data.npz")
+
         return training_data
 
 if __name__ == "__main__":
-    processor = DataProcessor()
+    processor = DataProcessor(fields=DOCUMENT_FIELDS)
     documents = processor.xml_to_json()
-    training_data = processor.create_training_collection(documents)
+    training_data = processor.create_training_collection(documents, seed=42)
     print(f"Created training collection with {len(training_data)} document pairs")
+    print(f"Pairs per similarity bucket: {processor.bucket_counts}")
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Stratified sampling of document pairs for the training collection.
+
+Uniformly random pairs almost never share a subject, so nearly all of them
+score 0 and teach the model little. PairSampler draws candidates from two
+sources:
+
+- an inverted index over the keyword and UDC/FOS tokens (the CSC form of
+  SimilarityLabeller's token matrices): pick a token occurrence at random,
+  then another document in the same posting list. These pairs share at least
+  one token, so they include the positives and the hard negatives (pairs
+  that overlap on a token but still score low), and drawing them costs
+  O(pairs), not an O(n²) scan;
+- uniformly random pairs, the easy negatives.
+
+Candidates are scored in batches and accepted into equal-width similarity
+buckets until every bucket has its share, so the collection is balanced
+across the score range. A fixed seed gives the same pairs.
+
+    sampler = PairSampler(SimilarityLabeller(documents), seed=42)
+    pairs = sampler.sample(1_000_000)          # structured array, PAIR_DTYPE
+    sampler.sample_to_file(1_000_000, "data/pairs.bin")
+    pairs = read_pairs("data/pairs.bin")       # memory-mapped, PAIR_DTYPE
+"""
+from pathlib import Path
+from typing import Iterator, Optional, Sequence, Union
+
+import numpy as np
+from scipy import sparse
+
+from similarity import SimilarityLabeller, TokenMatrix
+
+# One sampled pair: document indices and similarity score
+PAIR_DTYPE = np.dtype([('left', '<i4'), ('right', '<i4'), ('score', '<f8')])
+
+
+def read_pairs(path: Union[str, Path]) -> np.ndarray:
+    """
+    The pairs written by PairSampler.sample_to_file, as a read-only memmap
+    (an empty array for an empty file, which cannot be mapped).
+    """
+    if Path(path).stat().st_size == 0:
+        return np.empty(0, dtype=PAIR_DTYPE)
+    return np.memmap(path, dtype=PAIR_DTYPE, mode='r')
+
+
+class InvertedIndex:
+    """
+    Posting lists (documents per token) over one or more token matrices.
+
+    Tokens of different fields are kept apart, so "004" as a UDC class and
+    as a keyword are two different postings.
+    """
+
+    def __init__(self, matrices: Sequence[TokenMatrix]):
+        postings = sparse.hstack([m.matrix for m in matrices], format='csc')
+        self.indptr = postings.indptr.astype(np.int64)
+        self.documents = postings.indices
+        lengths = np.diff(self.indptr)
+        # Only tokens shared by two or more documents can give a pair
+        self.tokens = np.flatnonzero(lengths > 1)
+        occurrences = lengths[self.tokens].astype(np.float64)
+        self.weights = occurrences / occurrences.sum() if len(self.tokens) else occurrences
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def pairs(self, rng: np.random.Generator, size: int):
+        """
+        `size` pairs of distinct documents that share a token.
+
+        The token is drawn in proportion to its number of documents, i.e. a
+        random token occurrence, so a few very common tokens do not crowd
+        out the rarer, more specific ones as they would with one weight per
+        possible pair.
+        """
+        tokens = rng.choice(self.tokens, size=size, p=self.weights)
+        start = self.indptr[tokens]
+        length = self.indptr[tokens + 1] - start
+        first = rng.integers(length)
+        second = rng.integers(length - 1)
+        second += second >= first
+        return self.documents[start + first], self.documents[start + second]
+
+
+class PairSampler:
+    """
+    Draws document pairs balanced across similarity buckets.
+
+    Args:
+        labeller (SimilarityLabeller): Scores pairs; its documents are the
+            ones sampled.
+        seed (int, optional): Seed of the random generator. Defaults to None.
+        index_fields (Sequence[str]): Fields of the labeller whose tokens go
+            into the inverted index. Defaults to keywords and UDC/FOS subjects.
+        index_share (float): Fraction of candidates drawn from the inverted
+            index; the rest are uniformly random pairs. Defaults to 0.5.
+    """
+
+    def __init__(self, labeller: SimilarityLabeller, seed: Optional[int] = None,
+                 index_fields: Sequence[str] = ('keywords', 'subject'), index_share: float = 0.5):
+        self.labeller = labeller
+        self.rng = np.random.default_rng(seed)
+        self.index = InvertedIndex([labeller.matrix(name) for name in index_fields])
+        self.index_share = index_share if len(self.index) else 0.0
+        self.bucket_counts = None
+
+    def candidates(self, size: int):
+        """`size` candidate pairs (before deduplication), from the index and at random."""
+        n = self.labeller.n_documents
+        from_index = int(size * self.index_share)
+        left_index, right_index = self.index.pairs(self.rng, from_index) if from_index else ((), ())
+        left_random, right_random = self.rng.integers(n, size=(2, size - from_index))
+        return np.concatenate([left_index, left_random]), np.concatenate([right_index, right_random])
+
+    def iter_sample(self, n_pairs: int, buckets: int = 5, max_rounds: int = 50) -> Iterator[np.ndarray]:
+        """
+        Yield chunks (PAIR_DTYPE arrays) of distinct pairs, round by round.
+
+        Each round draws twice as many candidates as pairs still missing,
+        scores them and keeps, in random order, as many as every bucket
+        still needs. Sampling stops when all buckets are full, after
+        `max_rounds`, or when a round adds nothing (e.g. no pair can reach
+        the top bucket); `bucket_counts` then tells how full each one got.
+
+        Args:
+            n_pairs (int): Pairs wanted, split evenly over the buckets.
+            buckets (int): Number of equal-width score buckets over [0, 1].
+            max_rounds (int): Upper bound on the sampling rounds.
+        """
+        n = self.labeller.n_documents
+        quota = np.full(buckets, n_pairs // buckets, dtype=np.int64)
+        quota[:n_pairs % buckets] += 1
+        self.bucket_counts = np.zeros(buckets, dtype=np.int64)
+        seen = np.empty(0, dtype=np.int64)
+        if n < 2:
+            return
+
+        for _ in range(max_rounds):
+            missing = int(quota.sum())
+            if missing == 0:
+                break
+            left, right = self.candidates(max(2 * missing, 10000))
+
+            # Unordered, distinct pairs not accepted before, in random order
+            low, high = np.minimum(left, right), np.maximum(left, right)
+            keys = np.unique(low[low != high] * n + high[low != high])
+            keys = self.rng.permutation(keys[~np.isin(keys, seen)])
+            low, high = np.divmod(keys, n)
+
+            scores = self.labeller.scores(low, high)
+            bucket = np.minimum((scores * buckets).astype(np.int64), buckets - 1)
+
+            # Keep the first quota[b] candidates of every bucket b
+            order = np.argsort(bucket, kind='stable')
+            sorted_bucket = bucket[order]
+            rank = np.arange(len(order)) - np.searchsorted(sorted_bucket, sorted_bucket)
+            accepted = np.sort(order[rank < quota[sorted_bucket]])
+            if len(accepted) == 0:
+                break
+
+            chunk = np.empty(len(accepted), dtype=PAIR_DTYPE)
+            chunk['left'], chunk['right'], chunk['score'] = low[accepted], high[accepted], scores[accepted]
+            added = np.bincount(bucket[accepted], minlength=buckets)
+            quota -= added
+            self.bucket_counts += added
+            seen = np.concatenate([seen, keys[accepted]])
+            yield chunk
+
+    def sample(self, n_pairs: int, buckets: int = 5, max_rounds: int = 50) -> np.ndarray:
+        """All pairs of iter_sample in one PAIR_DTYPE array."""
+        chunks = list(self.iter_sample(n_pairs, buckets, max_rounds))
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=PAIR_DTYPE)
+
+    def sample_to_file(self, n_pairs: int, path: Union[str, Path], buckets: int = 5, max_rounds: int = 50) -> int:
+        """
+        Stream the pairs of iter_sample to `path` as raw PAIR_DTYPE records.
+
+        Every round is written as soon as it is accepted; read the file back
+        with `read_pairs(path)`.
+
+        Returns:
+            int: Number of pairs written.
+        """
+        written = 0
+        with open(path, 'wb') as f:
+            for chunk in self.iter_sample(n_pairs, buckets, max_rounds):
+                chunk.tofile(f)
+                written += len(chunk)
+        return written
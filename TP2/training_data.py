@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Compact training data: every abstract stored once, pairs stored as indices.
+
+training_data.json repeated both abstracts of every pair (indented), and
+the notebook loaded it whole into a DataFrame only to walk it with
+iterrows(). TrainingData keeps, in one compressed NPZ file:
+
+- `text`:    the distinct abstracts, UTF-8 encoded back to back (uint8)
+- `offsets`: start of each abstract in `text`, plus the end (int64, n + 1)
+- `pairs`:   one (left, right, score) record per pair (int32, int32, float32)
+
+Abstracts are decoded once when the file is loaded and pairs point at them,
+so batches for the trainer are built straight from the arrays.
+
+    data = TrainingData.load("data/training_data.npz")
+    train, val = data.split(test_size=0.2, seed=42)
+    for texts1, texts2, scores in train.batches(16, shuffle=True, seed=0):
+        ...
+    DataLoader(TrainingPairs(train, 16, seed=42), batch_size=16)   # for the trainer
+
+The NPZ file is generated (by process_data.create_training_collection, or
+from an existing training_data.json with the command below) and is not
+kept in the repository:
+
+    python training_data.py data/training_data.json
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+try:
+    from torch.utils.data import IterableDataset
+except ImportError:
+    # torch is only needed to train; the data itself does not depend on it
+    IterableDataset = object
+
+# One training pair: indices into the abstracts and the similarity score
+TRAINING_PAIR_DTYPE = np.dtype([('left', '<i4'), ('right', '<i4'), ('score', '<f4')])
+
+
+def as_text(abstract) -> str:
+    """
+    Text of an abstract. A repeated dc.description.abstract is a list; its
+    values are joined with spaces.
+    """
+    if isinstance(abstract, str):
+        return abstract
+    if isinstance(abstract, list):
+        return ' '.join(map(str, abstract))
+    return str(abstract)
+
+
+class TrainingData:
+    """
+    Distinct abstracts (`texts`) plus scored pairs of indices into them.
+
+    Args:
+        texts (List[str]): The distinct abstracts.
+        pairs (np.ndarray): TRAINING_PAIR_DTYPE records indexing `texts`.
+    """
+
+    def __init__(self, texts: List[str], pairs: np.ndarray):
+        self.texts = texts
+        self.pairs = pairs
+
+    @classmethod
+    def from_triples(cls, triples: Iterable[Sequence]) -> 'TrainingData':
+        """Build from [abstract1, abstract2, score] triples, e.g. an old training_data.json."""
+        ids: Dict[str, int] = {}
+        rows = [(ids.setdefault(as_text(a), len(ids)), ids.setdefault(as_text(b), len(ids)), score)
+                for a, b, score in triples]
+        return cls(list(ids), np.array(rows, dtype=TRAINING_PAIR_DTYPE))
+
+    @classmethod
+    def from_json(cls, path: Union[str, Path]) -> 'TrainingData':
+        """Read a training_data.json of [abstract1, abstract2, score] triples."""
+        with open(path, encoding='utf-8') as f:
+            return cls.from_triples(json.load(f))
+
+    @classmethod
+    def from_documents(cls, abstracts: Sequence[str], left: Sequence[int], right: Sequence[int],
+                       scores: Sequence[float]) -> 'TrainingData':
+        """
+        Build from pairs of document indices.
+
+        Only the abstracts of documents that appear in a pair are kept, and
+        identical abstracts are stored once.
+        """
+        left, right = np.asarray(left, dtype=np.int64), np.asarray(right, dtype=np.int64)
+        used = np.unique(np.concatenate([left, right]))
+        ids: Dict[str, int] = {}
+        remap = np.array([ids.setdefault(as_text(abstracts[doc]), len(ids)) for doc in used.tolist()],
+                         dtype=np.int32)
+        pairs = np.empty(len(left), dtype=TRAINING_PAIR_DTYPE)
+        pairs['left'] = remap[np.searchsorted(used, left)]
+        pairs['right'] = remap[np.searchsorted(used, right)]
+        pairs['score'] = scores
+        return cls(list(ids), pairs)
+
+    def save(self, path: Union[str, Path]):
+        """Write the compressed NPZ file."""
+        encoded = [t.encode('utf-8') for t in self.texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        text = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, text=text, offsets=offsets, pairs=self.pairs)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'TrainingData':
+        """Read a file written by `save`."""
+        with np.load(path) as data:
+            text = data['text'].tobytes()
+            offsets = data['offsets'].tolist()
+            pairs = data['pairs']
+        texts = [text[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+        return cls(texts, pairs)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    @property
+    def scores(self) -> np.ndarray:
+        return self.pairs['score']
+
+    def subset(self, indices: Sequence[int]) -> 'TrainingData':
+        """The pairs at `indices`, sharing the same abstracts."""
+        return TrainingData(self.texts, self.pairs[np.asarray(indices, dtype=np.int64)])
+
+    def split(self, test_size: float = 0.2, seed: Optional[int] = None) -> Tuple['TrainingData', 'TrainingData']:
+        """Random (train, validation) split of the pairs."""
+        order = np.random.default_rng(seed).permutation(len(self))
+        n_test = int(round(len(self) * test_size))
+        return self.subset(order[n_test:]), self.subset(order[:n_test])
+
+    def batches(self, batch_size: int = 16, shuffle: bool = False,
+                seed: Optional[int] = None) -> Iterator[Tuple[List[str], List[str], np.ndarray]]:
+        """
+        Yield (texts1, texts2, scores) batches, ready for the trainer.
+
+        Args:
+            batch_size (int): Pairs per batch; the last batch may be smaller.
+            shuffle (bool): Visit the pairs in random order.
+            seed (int, optional): Seed for the shuffle.
+        """
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else np.arange(len(self))
+        texts = self.texts
+        for start in range(0, len(order), batch_size):
+            batch = self.pairs[order[start:start + batch_size]]
+            yield ([texts[i] for i in batch['left'].tolist()], [texts[i] for i in batch['right'].tolist()],
+                   batch['score'])
+
+
+
+class TrainingPairs(IterableDataset):
+    """
+    InputExamples read from TrainingData.batches, reshuffled every epoch.
+
+    Args:
+        data (TrainingData): The pairs to train on.
+        batch_size (int): Pairs read from `data` at a time.
+        seed (int): Seed of the first epoch's shuffle; each epoch adds one.
+    """
+
+    def __init__(self, data: TrainingData, batch_size: int, seed: int = 0):
+        self.data, self.batch_size, self.seed, self.epoch = data, batch_size, seed, 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        from sentence_transformers import InputExample
+
+        self.epoch += 1
+        for texts1, texts2, scores in self.data.batches(self.batch_size, shuffle=True, seed=self.seed + self.epoch):
+            for text1, text2, score in zip(texts1, texts2, scores.tolist()):
+                yield InputExample(texts=[text1, text2], label=score)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a training_data.json into the compact NPZ format.")
+    parser.add_argument("json_file", type=Path)
+    parser.add_argument("-o", "--output", type=Path, help="defaults to the JSON file with an .npz suffix")
+    args = parser.parse_args()
+
+    data = TrainingData.from_json(args.json_file)
+    output = args.output or args.json_file.with_suffix('.npz')
+    data.save(output)
+    print(f"{len(data)} pairs, {len(data.texts)} distinct abstracts: "
+          f"{args.json_file.stat().st_size / 2**20:.1f}MB -> {output.stat().st_size / 2**20:.1f}MB ({output})")
+
+
+if __name__ == "__main__":
+    main()